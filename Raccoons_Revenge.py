@@ -21,12 +21,23 @@ This module contains all of the classes necessary for a1_game.py to run.
 from __future__ import annotations
 
 import random
-from random import shuffle
-from typing import List, Tuple, Optional
+from typing import List, Set, Tuple, Optional
 
-# Each raccoon moves every this many turns
+from Raccoons_Revenge_Index import EMPTY_TILE, PLAYER_TILE, RACCOON_TILE, \
+    SMART_RACCOON_TILE, CLOSED_CAN_TILE, OPEN_CAN_TILE, RECYCLING_BIN_TILE, \
+    RACCOON_IN_CAN_TILE, OPEN_TO_RACCOONS, EntityStore, Journal, TileIndex, \
+    check_tile_codes
+
+# By default, each raccoon moves every this many turns
 RACCOON_TURN_FREQUENCY = 20
 
+# By default, the Player keeps at most this many user inputs that it has not
+# responded to yet, forgetting the oldest ones first
+INPUT_QUEUE_SIZE = 8
+
+# By default, the Player responds to at most this many user inputs a turn
+MOVES_PER_TURN = 1
+
 # Directions dx, dy
 UP = (0, -1)
 DOWN = (0, 1)
@@ -35,13 +46,19 @@ RIGHT = (1, 0)
 DIRECTIONS = [LEFT, UP, RIGHT, DOWN]
 
 
-def get_shuffled_directions() -> List[Tuple[int, int]]:
+def get_shuffled_directions(rng: Optional[random.Random] = None) \
+        -> List[Tuple[int, int]]:
     """
     Provided helper that returns a shuffled copy of DIRECTIONS.
     You should use this where appropriate
+
+    The shuffle is made with <rng>, or with the random module if <rng> is
+    None; pass a board's rng to keep its game reproducible.
     """
+    if rng is None:
+        rng = random
     to_return = DIRECTIONS[:]
-    shuffle(to_return)
+    rng.shuffle(to_return)
     return to_return
 
 
@@ -57,6 +74,28 @@ class GameBoard:
         the number of squares wide this board is
     height:
         the number of squares high this board is
+    rng:
+        the random number generator that makes every random choice in this
+        game, so that a game started from the same seed with the same
+        player moves always plays out the same way
+    raccoon_turn_frequency:
+        each raccoon moves every this many turns
+    input_queue_size:
+        the most user inputs the player keeps without having responded to
+        them; when another is recorded, the oldest is forgotten
+    moves_per_turn:
+        the most user inputs the player responds to in a turn
+    events:
+        the keypress events recorded by the player that it has not
+        responded to yet, oldest first
+    tiles:
+        the tile code of every tile on this board, and what is kept up to
+        date from them
+    entities:
+        the state of every character on this board. Each character is
+        identified by its entity id (the order in which it was placed on
+        this board), and Character objects are thin views over the store,
+        made as needed, so two views of the same entity are equal.
 
 
     === Representation Invariants ===
@@ -72,27 +111,32 @@ class GameBoard:
     === Private Attributes ===
     _player:
         the player of the game
-    _raccoons:
-        the list of raccoons in the game.
-    _recycling_bins:
-        the list of recycling bins in the game
-    _garbage_cans:
-        the list of garbage cans in the game.
+    _journal:
+        every change made to this board since start_journal was called, or
+        None if changes are not being recorded
     """
     ended: bool
     turns: int
     width: int
     height: int
+    rng: random.Random
+    raccoon_turn_frequency: int
+    input_queue_size: int
+    moves_per_turn: int
+    events: Tuple[Tuple[int, int], ...]
+    tiles: TileIndex
+    entities: EntityStore
     _player: Optional[Player]
-    _raccoons: List[Raccoon]
-    _recycling_bins: List[RecyclingBin]
-    _garbage_cans: List[GarbageCan]
+    _journal: Optional[Journal]
 
-    def __init__(self, w: int, h: int) -> None:
+    def __init__(self, w: int, h: int, seed: Optional[int] = None) -> None:
         """Initialize this Board to be of the given width <w> and height <h> in
         squares. A board is initially empty (no characters) and no turns have
         been taken.
 
+        Random choices in the game are made by a random number generator
+        seeded with <seed>, or from the operating system if <seed> is None.
+
         >>> b = GameBoard(3, 3)
         >>> b.width == 3
         True
@@ -109,19 +153,22 @@ class GameBoard:
 
         self.width = w
         self.height = h
+        self.rng = random.Random(seed)
+        self.raccoon_turn_frequency = RACCOON_TURN_FREQUENCY
+        self.input_queue_size = INPUT_QUEUE_SIZE
+        self.moves_per_turn = MOVES_PER_TURN
 
         self._player = None
-        self._raccoons = []
-        self._recycling_bins = []
-        self._garbage_cans = []
+        self.events = ()
+        self.tiles = TileIndex(w, h)
+        self.entities = EntityStore(w * h)
+        self._journal = None
 
     def place_character(self, c: Character) -> None:
         """Record that character <c> is on this board.
 
-        This method should only be called from Character.__init__.
-
-        The decisions you made about new private attributes for class GameBoard
-        will determine what you do here.
+        This method should only be called from Character.__init__, after the
+        entity behind <c> has been added to the entity store of this board.
 
         Preconditions:
         - c.board == self
@@ -139,13 +186,138 @@ class GameBoard:
         True
         """
         if isinstance(c, Player):
+            if self._player is not None:
+                # the old player is no longer reachable through at()
+                self.entities.unlink(self._player.entity_id, self.tiles)
             self._player = c
-        if isinstance(c, Raccoon):
-            self._raccoons.append(c)
-        if isinstance(c, RecyclingBin):
-            self._recycling_bins.append(c)
-        if isinstance(c, GarbageCan):
-            self._garbage_cans.append(c)
+        self.entities.place(c.entity_id, self.tiles)
+
+    def _view(self, i: int) -> Character:
+        """Return a Character object for entity <i>.
+        """
+        return _KIND_CLASSES[self.entities.kinds[i]].view_of(self, i)
+
+    def changed_tiles(self) -> Set[Tuple[int, int]]:
+        """Return the set of tiles (x, y) whose character (as given by to_grid)
+        has changed since the last time this method was called, or since this
+        board was created.
+
+        >>> b = GameBoard(3, 1)
+        >>> p = Player(b, 0, 0)
+        >>> b.changed_tiles()
+        {(0, 0)}
+        >>> p.move(RIGHT)
+        True
+        >>> sorted(b.changed_tiles())
+        [(0, 0), (1, 0)]
+        >>> b.changed_tiles()
+        set()
+        >>> p.move(LEFT) and p.move(RIGHT)  # back where it was
+        True
+        >>> b.changed_tiles()
+        set()
+        """
+        return self.tiles.changed_tiles()
+
+    def zobrist_hash(self) -> int:
+        """Return a 64-bit hash of the characters shown on this board, as
+        given by str(self).
+
+        Boards of the same size that show the same characters always have
+        the same hash, and the hash is kept up to date as characters move,
+        so this takes constant time.
+
+        >>> b1 = GameBoard(3, 2)
+        >>> b1.setup_from_grid('P-R\\n-B@')
+        >>> b2 = GameBoard(3, 2)
+        >>> p = Player(b2, 1, 0)
+        >>> _ = Raccoon(b2, 2, 0)
+        >>> _ = RecyclingBin(b2, 1, 1)
+        >>> _ = GarbageCan(b2, 2, 1, False)
+        >>> b1.zobrist_hash() == b2.zobrist_hash()
+        False
+        >>> _ = Raccoon(b2, 2, 1)
+        >>> p.move(LEFT)
+        True
+        >>> str(b1) == str(b2) and b1.zobrist_hash() == b2.zobrist_hash()
+        True
+        """
+        return self.tiles.hash
+
+    def tile_codes(self) -> memoryview:
+        """Return a read-only view of the tile codes of this board: one byte
+        per tile in row-major order, holding the ASCII code of the character
+        to_grid gives for that tile.
+
+        The view reflects later changes to this board, until the board is
+        set up from a grid or restored.
+
+        >>> b = GameBoard(3, 1)
+        >>> p = Player(b, 0, 0)
+        >>> codes = b.tile_codes()
+        >>> bytes(codes)
+        b'P--'
+        >>> p.move(RIGHT)
+        True
+        >>> codes[1] == PLAYER_TILE
+        True
+        """
+        return memoryview(self.tiles.codes).toreadonly()
+
+    def set_kind(self, i: int, kind: int) -> None:
+        """Change the kind of entity <i>, as happens when a GarbageCan is
+        locked or unlocked, and update the tile code of its tile.
+        """
+        self.record(('kind', i, self.entities.kinds[i], kind))
+        self.entities.set_kind(i, kind, self.tiles)
+
+    def set_inside(self, i: int, inside: bool) -> None:
+        """Record whether the Raccoon entity <i> is inside a garbage can.
+        """
+        if bool(self.entities.inside[i]) != inside:
+            self.record(('inside', i, not inside, inside))
+        self.entities.set_inside(i, inside)
+
+    def _settle_raccoons(self) -> None:
+        """Bring the counts of trapped raccoons and raccoons inside a garbage
+        can up to date, the same way Raccoon.check_trapped does.
+        """
+        for i in self.entities.settle(self.tiles):
+            # recorded, so that redo puts the raccoon back inside the can
+            self.record(('inside', i, False, True))
+
+    def push_entities(self, i: int, k: int, direction: Tuple[int, int]) -> None:
+        """Move entity <i> and the <k> recycling bins in a row in front of it
+        one tile in <direction>.
+
+        When entity <i> is alone on its tile, the entity store shifts the
+        whole row at once, and only the tile it leaves and the tile the last
+        recycling bin moves onto change their tile codes.
+
+        Preconditions:
+        - the <k> tiles in front of entity <i> in <direction> are recycling
+          bins, and the tile after them is empty and on this board
+        """
+        if self.entities.shift(i, k, direction, self.tiles):
+            self.record(('push', i, k, direction))
+            return
+        # entity <i> shares its tile, so move one character at a time,
+        # starting from the far end of the row
+        dx, dy = direction
+        x, y = self.entities.xs[i], self.entities.ys[i]
+        for j in range(k, 0, -1):
+            bin_id = self.entities.ids_at(x + j * dx, y + j * dy, self.tiles)[0]
+            self.move_entity(bin_id, x + (j + 1) * dx, y + (j + 1) * dy)
+        self.move_entity(i, x + dx, y + dy)
+
+    def move_entity(self, i: int, x: int, y: int) -> None:
+        """Move entity <i> from its current tile to tile (x, y).
+        """
+        entities = self.entities
+        if (x, y) != (entities.xs[i], entities.ys[i]):
+            self.record(('move', i, entities.xs[i], entities.ys[i], x, y,
+                         bool(entities.inside[i])))
+        entities.move(i, x, y, self.tiles)
 
     def at(self, x: int, y: int) -> List[Character]:
         """Return the characters at tile (x, y).
@@ -168,20 +340,7 @@ class GameBoard:
         >>> b.at(0, 1)[0] == p
         True
         """
-        lst = []
-        if (self._player is not None) and self._player.x == x \
-                and self._player.y == y:
-            lst.append(self._player)
-        for raccoon in self._raccoons:
-            if raccoon.x == x and raccoon.y == y:
-                lst.append(raccoon)
-        for recycling_bin in self._recycling_bins:
-            if recycling_bin.x == x and recycling_bin.y == y:
-                lst.append(recycling_bin)
-        for garbage_can in self._garbage_cans:
-            if garbage_can.x == x and garbage_can.y == y:
-                lst.append(garbage_can)
-        return lst
+        return [self._view(i) for i in self.entities.ids_at(x, y, self.tiles)]
 
     def _chr(self, tile: Tuple[int, int]) -> chr:
         """
@@ -192,29 +351,8 @@ class GameBoard:
         >>> b._chr((1, 1))
         'B'
         """
-        x = tile[0]
-        y = tile[1]
-        grid_lst = self.at(x, y)
-        if len(grid_lst) == 0:
-            return '-'
-        if len(grid_lst) == 1:
-            ch = grid_lst[0]
-            if isinstance(ch, RecyclingBin):
-                return 'B'
-            if isinstance(ch, Raccoon):
-                if isinstance(ch, SmartRaccoon):
-                    return 'S'
-                else:
-                    return 'R'
-            if isinstance(ch, GarbageCan):
-                if ch.locked is True:
-                    return 'C'
-                else:
-                    return 'O'
-            else:
-                return 'P'
-        else:
-            return '@'
+        code = self.tiles.code(tile[0], tile[1])
+        return chr(EMPTY_TILE if code is None else code)
 
     def to_grid(self) -> List[List[chr]]:
         """
@@ -238,15 +376,9 @@ class GameBoard:
         >>> b.to_grid()
         [['P', '-', '-'], ['-', 'R', 'C']]
         """
-        outer_lst = []
-        for i in range(self.height):
-            inner_lst = []
-            for j in range(self.width):
-                tile = (j, i)
-                ch = self._chr(tile)
-                inner_lst.append(ch)
-            outer_lst.append(inner_lst)
-        return outer_lst
+        w = self.width
+        return [list(self.tiles.codes[i * w:(i + 1) * w].decode())
+                for i in range(self.height)]
 
     def __str__(self) -> str:
         """
@@ -267,14 +399,17 @@ class GameBoard:
         >>> str(b)
         'P--\\n-RO'
         """
-        board_lst = self.to_grid()
-        board_str = ''
-        for inner_lst in board_lst:
-            for grid_str in inner_lst:
-                board_str += grid_str
-            board_str += '\n'
-        board_str = board_str[:-1]
-        return board_str
+        return self.tiles.text()
+
+    def _reset(self, w: int, h: int) -> None:
+        """Reset this board to an empty <w> by <h> board, where the game
+        carries on with the same random numbers and settings.
+        """
+        settings = (self.rng, self.raccoon_turn_frequency,
+                    self.input_queue_size, self.moves_per_turn)
+        self.__init__(w, h)
+        self.rng, self.raccoon_turn_frequency, self.input_queue_size, \
+            self.moves_per_turn = settings
 
     def setup_from_grid(self, grid: str) -> None:
         """
@@ -299,7 +434,8 @@ class GameBoard:
         lines = grid.split("\n")
         width = len(lines[0])
         height = len(lines)
-        self.__init__(width, height)  # reset the board to an empty board
+        old_tiles = self.tiles
+        self._reset(width, height)  # reset the board to an empty board
         y = 0
         for line in lines:
             x = 0
@@ -324,6 +460,228 @@ class GameBoard:
                     # method precondition)
                 x += 1
             y += 1
+        self.tiles.inherit_changes(old_tiles)
+
+    def setup_from_codes(self, width: int, height: int, codes: bytes) -> None:
+        """Set the state of this GameBoard to a <width> by <height> board with
+        the given tile <codes>, in the format of tile_codes, with the same
+        characters setup_from_grid would make for the same board.
+
+        Rather than placing the characters one at a time, this fills in the
+        entity store and tile index of the board directly, so it is much
+        faster for large boards.
+
+        Raise a ValueError, leaving this board unchanged, if <codes> is not
+        width * height bytes long or holds a byte that is not a tile code.
+
+        Precondition: at most one byte of <codes> is PLAYER_TILE
+
+        >>> b = GameBoard(1, 1)
+        >>> b.setup_from_codes(4, 2, b'P-B@-BRC')
+        >>> print(b)
+        P-B@
+        -BRC
+        >>> [type(c).__name__ for c in b.at(3, 0)]
+        ['Raccoon', 'GarbageCan']
+        >>> b.setup_from_codes(2, 1, b'P?')
+        Traceback (most recent call last):
+        ...
+        ValueError: b'?' is not a tile code
+        """
+        check_tile_codes(codes, width * height)
+        old_tiles = self.tiles
+        self._reset(width, height)  # reset the board to an empty board
+        self.tiles.fill(codes)
+        self.tiles.inherit_changes(old_tiles)
+        player = self.entities.fill(self.tiles)
+        self._player = None if player is None else self._view(player)
+
+    def start_journal(self) -> None:
+        """Start recording every change made to this board from now on, so
+        that whole turns can be taken back with undo and made again with
+        redo. Anything recorded before is forgotten.
+
+        Precondition: no characters are placed on this board while changes
+        are being recorded
+        """
+        self._journal = Journal()
+
+    def stop_journal(self) -> None:
+        """Stop recording changes made to this board, and forget the ones
+        recorded so far.
+        """
+        self._journal = None
+
+    def record(self, change: tuple) -> None:
+        """Record <change> in the journal, if changes are being recorded.
+        """
+        if self._journal is not None:
+            self._journal.record(change)
+
+    def undo(self) -> bool:
+        """Take back the changes made in the last turn recorded in the
+        journal, or those made since it if there are any, and return whether
+        there was anything to take back. This takes time proportional to the
+        number of changes taken back.
+
+        Random choices made during the turn are not taken back, so redoing
+        the turn makes the same changes but playing it again may not.
+
+        >>> b = GameBoard(4, 1)
+        >>> b.setup_from_grid('PB--')
+        >>> b.start_journal()
+        >>> b.handle_event(RIGHT)
+        >>> b.give_turns()
+        >>> b.handle_event(RIGHT)
+        >>> b.give_turns()
+        >>> str(b), b.turns
+        ('--PB', 2)
+        >>> b.undo()
+        True
+        >>> str(b), b.turns
+        ('-PB-', 1)
+        >>> b.undo()
+        True
+        >>> str(b), b.turns
+        ('PB--', 0)
+        >>> b.undo()
+        False
+        >>> b.redo() and b.redo()
+        True
+        >>> str(b), b.turns, b.redo()
+        ('--PB', 2, False)
+        """
+        return self._journal is not None and self._journal.undo(self._apply)
+
+    def redo(self) -> bool:
+        """Make again the changes of the last turn taken back with undo,
+        unless other changes have been made since, and return whether there
+        was anything to make again.
+
+        >>> b = GameBoard(5, 2)
+        >>> b.setup_from_grid('P----\\n--S-O')
+        >>> b.start_journal()
+        >>> for _ in range(2 * RACCOON_TURN_FREQUENCY):
+        ...     b.give_turns()
+        >>> s = b.at(4, 1)[0]
+        >>> s.inside_can, s.get_char()
+        (True, '@')
+        >>> b.undo() and b.redo()
+        True
+        >>> str(b), s.inside_can, s.get_char()
+        ('P----\\n----@', True, '@')
+        """
+        return self._journal is not None and self._journal.redo(self._apply)
+
+    def _apply(self, change: tuple, backwards: bool) -> None:
+        """Make the recorded <change> to this board, or unmake it if
+        <backwards> is True.
+
+        Precondition: this board is in the state it was in just after
+        <change> was made if <backwards>, and just before it otherwise
+        """
+        kind = change[0]
+        if kind == 'move':
+            i, old_x, old_y, x, y, was_inside = change[1:]
+            if backwards:
+                self.move_entity(i, old_x, old_y)
+                # whether a raccoon is inside a garbage can is also noticed
+                # from its tile without a change being recorded
+                self.set_inside(i, was_inside)
+            else:
+                self.move_entity(i, x, y)
+        elif kind == 'push':
+            i, k, (dx, dy) = change[1:]
+            if backwards:
+                # the last recycling bin pushed is now alone on the tile
+                # <k> tiles past entity <i>, so push the row back from there
+                last = self.entities.ids_at(self.entities.xs[i] + k * dx,
+                                            self.entities.ys[i] + k * dy,
+                                            self.tiles)[0]
+                self.push_entities(last, k, (-dx, -dy))
+            else:
+                self.push_entities(i, k, (dx, dy))
+        elif kind == 'kind':
+            self.set_kind(change[1], change[2 if backwards else 3])
+        elif kind == 'inside':
+            self.set_inside(change[1], change[2 if backwards else 3])
+        else:
+            setattr(self, change[1], change[2 if backwards else 3])
+
+    def clone(self) -> GameBoard:
+        """Return an independent copy of this board, in exactly the same
+        state: the same characters with the same kinds (including smart
+        raccoons inside garbage cans), the same number of turns, the same
+        pending Player moves, the same state of its random number generator,
+        and the same tiles left to report from changed_tiles.
+
+        >>> b = GameBoard(3, 1)
+        >>> b.setup_from_grid('P-O')
+        >>> s = SmartRaccoon(b, 2, 0)
+        >>> s.inside_can = True
+        >>> b.turns = 5
+        >>> b.handle_event(RIGHT)
+        >>> c = b.clone()
+        >>> str(c), c.turns, isinstance(c.at(2, 0)[0], SmartRaccoon)
+        ('P-@', 5, True)
+        >>> c.give_turns()
+        >>> str(c), str(b)
+        ('-P@', 'P-@')
+        """
+        board = GameBoard(0, 0)
+        board._copy_state(self)
+        return board
+
+    def snapshot(self) -> GameBoard:
+        """Return a snapshot of the state of this board, which restore can
+        bring this board back to any number of times.
+
+        >>> b = GameBoard(3, 1)
+        >>> b.setup_from_grid('PB-')
+        >>> snap = b.snapshot()
+        >>> b.handle_event(RIGHT)
+        >>> b.give_turns()
+        >>> str(b), b.turns
+        ('-PB', 1)
+        >>> _ = b.changed_tiles()
+        >>> b.restore(snap)
+        >>> str(b), b.turns
+        ('PB-', 0)
+        >>> sorted(b.changed_tiles())
+        [(0, 0), (1, 0), (2, 0)]
+        """
+        return self.clone()
+
+    def restore(self, snapshot: GameBoard) -> None:
+        """Bring this board to the state of <snapshot>, a board returned by
+        snapshot or clone. The snapshot is not changed, so it can be restored
+        again later.
+
+        The tiles whose characters differ afterwards count as changed for
+        changed_tiles.
+        """
+        old_tiles = self.tiles
+        self._copy_state(snapshot)
+        self.tiles.inherit_changes(old_tiles)
+
+    def _copy_state(self, other: GameBoard) -> None:
+        """Make the state of this board a copy of the state of board <other>.
+        """
+        self.ended = other.ended
+        self.turns = other.turns
+        self.width = other.width
+        self.height = other.height
+        self.rng.setstate(other.rng.getstate())
+        self.raccoon_turn_frequency = other.raccoon_turn_frequency
+        self.input_queue_size = other.input_queue_size
+        self.moves_per_turn = other.moves_per_turn
+        self.events = other.events
+        self.tiles = other.tiles.copy()
+        self.entities = other.entities.copy()
+        self._journal = None if other._journal is None \
+            else other._journal.copy()
+        self._player = None if other._player is None \
+            else self._view(other._player.entity_id)
 
     # a helper method you may find useful in places
     def on_board(self, x: int, y: int) -> bool:
@@ -332,12 +690,34 @@ class GameBoard:
         """
         return 0 <= x <= self.width - 1 and 0 <= y <= self.height - 1
 
+    def raccoon_moves(self) \
+            -> List[Tuple[Raccoon, bool, List[Tuple[int, int]]]]:
+        """Return, for every raccoon on this board in the order they were
+        placed, a tuple of the raccoon, whether it is trapped, and the
+        directions it could move in on its turn.
+
+        The trapped state agrees with Raccoon.check_trapped, and the
+        directions, in the order of DIRECTIONS, are the ones Raccoon.take_turn
+        would choose from, so they are empty for a raccoon that is trapped or
+        inside a garbage can. Unlike check_trapped, this does not change
+        whether any raccoon is inside a garbage can.
+
+        >>> b = GameBoard(3, 3)
+        >>> b.setup_from_grid('R-B\\n-BR\\n--B')
+        >>> for r, trapped, moves in b.raccoon_moves():
+        ...     print((r.x, r.y), trapped, moves)
+        (0, 0) False [(1, 0), (0, 1)]
+        (2, 1) True []
+        """
+        return [(self._view(i), trapped, moves) for i, trapped, moves
+                in self.entities.raccoon_moves(self.tiles)]
+
     def give_turns(self) -> None:
         """Give every turn-taking character one turn in the game.
 
         The Player should take their turn first and the number of turns
         should be incremented by one. Then each other TurnTaker
-        should be given a turn if RACCOON_TURN_FREQUENCY turns have occurred
+        should be given a turn if raccoon_turn_frequency turns have occurred
         since the last time the TurnTakers were given their turn.
 
         After all turns are taken, check_game_end should be called to
@@ -368,11 +748,15 @@ class GameBoard:
         """
         self._player.take_turn()
         self.turns += 1  # PROVIDED, DO NOT CHANGE
+        self.record(('attr', 'turns', self.turns - 1, self.turns))
 
-        if self.turns % RACCOON_TURN_FREQUENCY == 0:  # PROVIDED, DO NOT CHANGE
-            for raccoon in self._raccoons:
-                raccoon.take_turn()
+        # PROVIDED, DO NOT CHANGE, apart from the frequency being per board
+        if self.turns % self.raccoon_turn_frequency == 0:
+            for i in self.entities.raccoons:
+                self._view(i).take_turn()
         self.check_game_end()  # PROVIDED, DO NOT CHANGE
+        if self._journal is not None:
+            self._journal.end_turn()
 
     def handle_event(self, event: Tuple[int, int]) -> None:
         """Handle a user-input event.
@@ -382,6 +766,23 @@ class GameBoard:
         """
         self._player.record_event(event)
 
+    def pending_events(self) -> int:
+        """Return the number of user-input events the Player has recorded and
+        not responded to yet.
+        """
+        return len(self.events)
+
+    def player_position(self) -> Optional[Tuple[int, int]]:
+        """Return the location of the Player, or None if there is none.
+
+        >>> b = GameBoard(3, 2)
+        >>> b.setup_from_grid('-B-\\n--P')
+        >>> b.player_position()
+        (2, 1)
+        """
+        p = self._player
+        return None if p is None else (p.x, p.y)
+
     def check_game_end(self) -> Optional[int]:
         """Check if this game has ended. A game ends when all the raccoons on
         this game board are either inside a can or trapped.
@@ -408,38 +809,45 @@ class GameBoard:
         >>> b.ended
         True
         """
-        trapped_lst = []
-        all_r_trapped = False
-        for r in self._raccoons:
-            if r.check_trapped() and r.inside_can is False:
-                trapped_lst.append(r)
-        if len(trapped_lst) == len(self._raccoons):
-            all_r_trapped = True
-
-        inside_lst = []
-        all_r_inside = False
-        for r in self._raccoons:
-            if r.inside_can:
-                inside_lst.append(r)
-        if len(inside_lst) == len(self._raccoons):
-            all_r_inside = True
-
+        # only the raccoons near tiles that changed since the last check
+        # need to be checked again
+        self._settle_raccoons()
+        raccoons = len(self.entities.raccoons)
+        all_r_trapped = self.entities.num_trapped == raccoons
+        all_r_inside = self.entities.num_inside == raccoons
+
+        if (all_r_trapped or all_r_inside) and not self.ended:
+            self.record(('attr', 'ended', False, True))
         if all_r_trapped:
             self.ended = True
-            return len(self._raccoons) * 10 + self.adjacent_bin_score()
+            return raccoons * 10 + self.adjacent_bin_score()
         elif all_r_inside:
             self.ended = True
             return self.adjacent_bin_score()
         else:
             return None
 
+    def raccoon_counts(self) -> Tuple[int, int]:
+        """Return the number of raccoons on this board that are trapped and
+        the number that are inside a garbage can, as check_game_end counts
+        them.
+
+        >>> b = GameBoard(3, 2)
+        >>> b.setup_from_grid('RB-\\nB@-')
+        >>> b.raccoon_counts()
+        (1, 1)
+        """
+        self._settle_raccoons()
+        return self.entities.num_trapped, self.entities.num_inside
+
     def adjacent_bin_score(self) -> int:
         """
         Return the size of the largest cluster of adjacent recycling bins
         on this board.
 
         Two recycling bins are adjacent when they are directly beside each other
-        in one of the four directions (up, down, left, right).
+        in one of the four directions (up, down, left, right). If there are no
+        recycling bins, the score is 0.
 
         See Task #5 in the handout for ideas if you aren't sure how
         to approach this problem.
@@ -468,50 +876,14 @@ class GameBoard:
         --B
         >>> b.adjacent_bin_score()
         5
+        >>> GameBoard(2, 2).adjacent_bin_score()
+        0
         """
-        rb_left_lst = self._recycling_bins.copy()
-        score_lst = []
-        while len(rb_left_lst) != 0:
-            rb0 = random.choice(rb_left_lst)
-            dictionary = {}
-            next_q = list([])
-            next_q.append(rb0)
-            while len(next_q) != 0:
-                a = next_q.pop(0)
-                dictionary[a] = self._adj(a)
-                change_next_q(dictionary, a, next_q)
-            adj_rb_lst = dictionary.keys()
-            score = len(adj_rb_lst)
-            score_lst.append(score)
-            rb_left_lst = list(set(rb_left_lst) - set(adj_rb_lst))
-        return max(score_lst)
-
-    def _adj(self, rb: RecyclingBin) -> List[RecyclingBin]:
-        """Return a list of all the recycling bins which are adjacent to the
-        recycling bin rb on this board.
-
-        The order of the list should correspond with the order in DIRECTIONS.
-
-        Precondition: rb is on the board.
-        >>> b = GameBoard(5, 5)
-        >>> _ = RecyclingBin(b, 0, 1)
-        >>> _ = RecyclingBin(b, 0, 0)
-        >>> rb_l = b._adj(RecyclingBin(b, 0, 1))
-        >>> char = rb_l[0]
-        >>> chr_x = char.x
-        >>> chr_y = char.y
-        >>> b.at(chr_x, chr_y)[0] in rb_l
-        True
-        """
-        rb_lst = []
-        for direction in DIRECTIONS:
-            next_x = rb.x + direction[0]
-            next_y = rb.y + direction[1]
-            if self.on_board(next_x, next_y):
-                next_lst = self.at(next_x, next_y)
-                if len(next_lst) == 1 and isinstance(next_lst[0], RecyclingBin):
-                    rb_lst.append(next_lst[0])
-        return rb_lst
+        largest = self.tiles.largest_cluster()
+        if largest == 0 and len(self.entities.recycling_bins) > 0:
+            # every recycling bin shares its tile, so none are adjacent
+            return 1
+        return largest
 
 
 class Character:
@@ -530,13 +902,22 @@ class Character:
         the game board that this Character is on
     x, y:
         the coordinates of this Character on the board
+    entity_id:
+        the id of the entity behind this Character in the entity store of
+        its board, which holds all of its state. Assigning to x or y keeps
+        the tile index of the board up to date.
 
     === Representation Invariants ===
     x, y are valid coordinates in board (i.e. board.on_board(x, y) is True)
+
+    === Private Attributes ===
+    _kind:
+        the tile code of a tile holding just this kind of Character
     """
+    __slots__ = ('board', 'entity_id')
     board: GameBoard
-    x: int
-    y: int
+    entity_id: int
+    _kind: int
 
     def __init__(self, b: GameBoard, x: int, y: int) -> None:
         """Initialize this Character with board <b>, and
@@ -547,9 +928,64 @@ class Character:
         preconditions of place_character, which must be satisfied.
         """
         self.board = b
-        self.x, self.y = x, y
+        self.entity_id = b.entities.new(self._kind, x, y)
         self.board.place_character(self)  # this associates self with the board!
 
+    @classmethod
+    def view_of(cls, b: GameBoard, i: int) -> Character:
+        """Return a new Character of this class that is a view of the entity
+        <i> already in the entity store of board <b>.
+        """
+        c = cls.__new__(cls)
+        c.board = b
+        c.entity_id = i
+        return c
+
+    def __eq__(self, other: object) -> bool:
+        """Return whether <other> is a view of the same character as this
+        Character.
+
+        >>> b = GameBoard(2, 1)
+        >>> rb = RecyclingBin(b, 1, 0)
+        >>> b.at(1, 0)[0] == rb
+        True
+        >>> RecyclingBin(b, 0, 0) == rb
+        False
+        """
+        return isinstance(other, Character) and self.board is other.board \
+            and self.entity_id == other.entity_id
+
+    def __hash__(self) -> int:
+        return hash((id(self.board), self.entity_id))
+
+    @property
+    def x(self) -> int:
+        """The x coordinate of this Character on the board.
+
+        >>> b = GameBoard(3, 1)
+        >>> rb = RecyclingBin(b, 0, 0)
+        >>> rb.x = 2
+        >>> b.at(2, 0) == [rb] and b.at(0, 0) == []
+        True
+        """
+        return self.board.entities.xs[self.entity_id]
+
+    @x.setter
+    def x(self, value: int) -> None:
+        if value != self.x:
+            self.board.move_entity(self.entity_id, value, self.y)
+
+    @property
+    def y(self) -> int:
+        """The y coordinate of this Character on the board.
+        """
+        return self.board.entities.ys[self.entity_id]
+
+    @y.setter
+    def y(self, value: int) -> None:
+        if value != self.y:
+            self.board.move_entity(self.entity_id, self.x, value)
+
     def move(self, direction: Tuple[int, int]) -> bool:
         """
         Move this character to the tile
@@ -577,6 +1013,7 @@ class TurnTaker(Character):
 
     This class is abstract and should not be directly instantiated.
     """
+    __slots__ = ()
 
     def take_turn(self) -> None:
         """
@@ -593,6 +1030,8 @@ class RecyclingBin(Character):
     >>> rb.x, rb.y
     (2, 1)
     """
+    __slots__ = ()
+    _kind = RECYCLING_BIN_TILE
 
     def move(self, direction: Tuple[int, int]) -> bool:
         """Move this recycling bin to tile:
@@ -617,38 +1056,26 @@ class RecyclingBin(Character):
         True
         >>> b.at(0, 1) == [rb]
         True
+        >>> b.setup_from_grid('BBB-\\n----')
+        >>> rb = b.at(0, 0)[0]
+        >>> rb.move(RIGHT)
+        True
+        >>> str(b)
+        '-BBB\\n----'
+        >>> b.at(1, 0) == [rb]
+        True
         """
-        all_rb_lst = [self]
-        next_x = self.x + direction[0]
-        next_y = self.y + direction[1]
-        next_lst = self.board.at(next_x, next_y)
-        while (len(next_lst) == 1) and isinstance(next_lst[0], RecyclingBin) \
-                and (self.board.on_board(next_x, next_y) is True):
-            all_rb_lst.append(next_lst[0])
-            next_x += direction[0]
-            next_y += direction[1]
-            next_lst = self.board.at(next_x, next_y)
-        rb_last = all_rb_lst[-1]
-        f_next_x = rb_last.x + direction[0]
-        f_next_y = rb_last.y + direction[1]
-        if self.board.on_board(f_next_x, f_next_y) is False:
+        # the recycling bins in a row in front of this one get pushed along
+        # with it, and the board knows where that row ends without walking it
+        num_pushed = self.board.tiles.bin_run(self.x + direction[0],
+                                              self.y + direction[1],
+                                              direction)
+        f_next_x = self.x + (num_pushed + 1) * direction[0]
+        f_next_y = self.y + (num_pushed + 1) * direction[1]
+        if self.board.tiles.code(f_next_x, f_next_y) != EMPTY_TILE:
             return False
-        else:
-            if len(self.board.at(f_next_x, f_next_y)) == 0 and \
-                    len(all_rb_lst) == 1:
-                rb_last.x = f_next_x
-                rb_last.y = f_next_y
-                return True
-            if len(self.board.at(f_next_x, f_next_y)) == 0 and \
-                    len(all_rb_lst) != 1:
-                for i in range(len(all_rb_lst) - 1):
-                    all_rb_lst[i].x = all_rb_lst[i + 1].x
-                    all_rb_lst[i].y = all_rb_lst[i + 1].y
-                rb_last.x = f_next_x
-                rb_last.y = f_next_y
-                return True
-            else:
-                return False
+        self.board.push_entities(self.entity_id, num_pushed, direction)
+        return True
 
     def get_char(self) -> chr:
         """
@@ -674,36 +1101,69 @@ class Player(TurnTaker):
     True
     """
     # === Private Attributes ===
-    # _last_event:
-    #   The direction corresponding to the last keypress event that the user
-    #   made, or None if there is currently no keypress event left to process
-    _last_event: Optional[Tuple[int, int]]
+    # _events:
+    #   The directions corresponding to the keypress events that the user
+    #   made and that have not been processed yet, oldest first.
+    #   This is kept by the board, so that every view of the Player sees it.
+    __slots__ = ()
+    _kind = PLAYER_TILE
 
     def __init__(self, b: GameBoard, x: int, y: int) -> None:
         """Initialize this Player with board <b>,
         and at tile (<x>, <y>)."""
 
         TurnTaker.__init__(self, b, x, y)
-        self._last_event = None
+        self._events = ()
+
+    @property
+    def _events(self) -> Tuple[Tuple[int, int], ...]:
+        return self.board.events
+
+    @_events.setter
+    def _events(self, value: Tuple[Tuple[int, int], ...]) -> None:
+        if value != self.board.events:
+            self.board.record(('attr', 'events', self.board.events, value))
+        self.board.events = value
 
     def record_event(self, direction: Tuple[int, int]) -> None:
-        """Record that <direction> is the last direction that the user
-        has specified for this Player to move. Next time take_turn is called,
-        this direction will be used.
+        """Record that <direction> is the next direction that the user
+        has specified for this Player to move, after any recorded before that
+        have not been used yet. The next time take_turn is called, the
+        directions are used in the order they were recorded.
+
+        At most the board's input_queue_size directions are kept, so if there
+        are already that many, the oldest one is forgotten.
+
         Precondition:
         direction is in DIRECTIONS
+
+        >>> b = GameBoard(3, 1)
+        >>> b.input_queue_size = 2
+        >>> p = Player(b, 0, 0)
+        >>> for direction in (LEFT, RIGHT, RIGHT):
+        ...     p.record_event(direction)
+        >>> b.pending_events()
+        2
+        >>> p.take_turn()
+        >>> (p.x, p.y), b.pending_events()
+        ((1, 0), 1)
         """
-        self._last_event = direction
+        events = self._events + (direction,)
+        self._events = events[max(0, len(events)
+                                  - self.board.input_queue_size):]
 
     def take_turn(self) -> None:
         """Take a turn in the game.
 
-        For a Player, this means responding to the last user input recorded
-        by a call to record_event.
+        For a Player, this means responding to the user inputs recorded by
+        calls to record_event, oldest first, up to the board's
+        moves_per_turn of them.
         """
-        if self._last_event is not None:
-            self.move(self._last_event)
-            self._last_event = None
+        if self._events:
+            events = self._events
+            self._events = events[self.board.moves_per_turn:]
+            for direction in events[:self.board.moves_per_turn]:
+                self.move(direction)
 
     def move(self, direction: Tuple[int, int]) -> bool:
         """Attempt to move this Player to the tile:
@@ -796,7 +1256,8 @@ class Raccoon(TurnTaker):
     >>> r.inside_can
     False
     """
-    inside_can: bool
+    __slots__ = ()
+    _kind = RACCOON_TILE
 
     def __init__(self, b: GameBoard, x: int, y: int) -> None:
         """Initialize this Raccoon with board <b>, and
@@ -805,13 +1266,21 @@ class Raccoon(TurnTaker):
 
         >>> r = Raccoon(GameBoard(5, 5), 5, 10)
         """
-        self.inside_can = False
-        # since this raccoon may be placed inside an open garbage can,
-        # we need to initially set the inside_can attribute
-        # BEFORE calling the parent init, which is where the raccoon is actually
-        # placed on the board.
+        # the entity store starts every raccoon outside of a garbage can;
+        # one placed directly inside an open GarbageCan is noticed by
+        # check_trapped.
         TurnTaker.__init__(self, b, x, y)
 
+    @property
+    def inside_can(self) -> bool:
+        """Whether or not this Raccoon is inside a garbage can.
+        """
+        return bool(self.board.entities.inside[self.entity_id])
+
+    @inside_can.setter
+    def inside_can(self, value: bool) -> None:
+        self.board.set_inside(self.entity_id, value)
+
     def check_trapped(self) -> bool:
         """Return True iff this raccoon is trapped. A trapped raccoon is
         surrounded on 4 sides (diagonals don't matter) by recycling bins, other
@@ -831,19 +1300,13 @@ class Raccoon(TurnTaker):
         >>> r.check_trapped()
         True
         """
-        now_lst = self.board.at(self.x, self.y)
-        if len(now_lst) == 2:
+        if self.board.tiles.code(self.x, self.y) == RACCOON_IN_CAN_TILE:
             self.inside_can = True
         for direction in DIRECTIONS:
-            next_x = self.x + direction[0]
-            next_y = self.y + direction[1]
-            next_lst = self.board.at(next_x, next_y)
-            if self.board.on_board(next_x, next_y) and len(next_lst) == 0:
+            code = self.board.tiles.code(self.x + direction[0],
+                                         self.y + direction[1])
+            if code in OPEN_TO_RACCOONS:
                 return False
-            if self.board.on_board(next_x, next_y) and len(next_lst) == 1:
-                ch = next_lst[0]
-                if isinstance(ch, GarbageCan):
-                    return False
         return True
 
     def move(self, direction: Tuple[int, int]) -> bool:
@@ -934,15 +1397,11 @@ class Raccoon(TurnTaker):
         if self.check_trapped() is False and self.inside_can is False:
             direction_lst = []
             for direction in DIRECTIONS:
-                next_x = self.x + direction[0]
-                next_y = self.y + direction[1]
-                next_lst = self.board.at(next_x, next_y)
-                if self.board.on_board(next_x, next_y) and len(next_lst) == 0:
+                code = self.board.tiles.code(self.x + direction[0],
+                                             self.y + direction[1])
+                if code in OPEN_TO_RACCOONS:
                     direction_lst.append(direction)
-                if self.board.on_board(next_x, next_y) and len(next_lst) == 1 \
-                        and isinstance(next_lst[0], GarbageCan):
-                    direction_lst.append(direction)
-            direction = random.choice(direction_lst)
+            direction = self.board.rng.choice(direction_lst)
             self.move(direction)
 
     def get_char(self) -> chr:
@@ -972,6 +1431,8 @@ class SmartRaccoon(Raccoon):
     >>> s.inside_can
     False
     """
+    __slots__ = ()
+    _kind = SMART_RACCOON_TILE
 
     def take_turn(self) -> None:
         """Take a turn in the game.
@@ -1005,25 +1466,13 @@ class SmartRaccoon(Raccoon):
         """
         direction_lst = []
         distance_lst = []
+        # the Player does not block the line of sight
         for direction in DIRECTIONS:
-            next_x = self.x + direction[0]
-            next_y = self.y + direction[1]
-            if self.board.on_board(next_x, next_y) is True:
-                next_lst = self.board.at(next_x, next_y)
-                num = 0
-                while (len(next_lst) == 0 or isinstance(
-                        next_lst[0], Player)) and (
-                        self.board.on_board(next_x, next_y) is True):
-                    next_x += direction[0]
-                    next_y += direction[1]
-                    next_lst = self.board.at(next_x, next_y)
-                    num += 1
-                distance = num + 1
-                if len(next_lst) == 1 and \
-                        isinstance(next_lst[0], GarbageCan) and \
-                        next_lst[0].locked is False:
-                    direction_lst.append(direction)
-                    distance_lst.append(distance)
+            distance = self.board.tiles.sight_distance(
+                self.x, self.y, direction, self.board.player_position())
+            if distance is not None:
+                direction_lst.append(direction)
+                distance_lst.append(distance)
         if len(direction_lst) == 0:
             # act like regular raccoon
             Raccoon.take_turn(self)
@@ -1053,6 +1502,7 @@ class GarbageCan(Character):
     locked:
         whether or not this GarbageCan is locked.
 
+
     === Sample Usage ===
     >>> b = GameBoard(2, 2)
     >>> g = GarbageCan(b, 0, 0, False)
@@ -1061,7 +1511,8 @@ class GarbageCan(Character):
     >>> g.locked
     False
     """
-    locked: bool
+    __slots__ = ()
+    _kind = OPEN_CAN_TILE
 
     def __init__(self, b: GameBoard, x: int, y: int, locked: bool) -> None:
         """Initialize this GarbageCan to be at tile (<x>, <y>) and store
@@ -1071,6 +1522,25 @@ class GarbageCan(Character):
         Character.__init__(self, b, x, y)
         self.locked = locked
 
+    @property
+    def locked(self) -> bool:
+        """Whether or not this GarbageCan is locked.
+
+        >>> b = GameBoard(2, 1)
+        >>> g = GarbageCan(b, 1, 0, False)
+        >>> g.locked = True
+        >>> str(b)
+        '-C'
+        """
+        return self.board.entities.kinds[self.entity_id] == CLOSED_CAN_TILE
+
+    @locked.setter
+    def locked(self, value: bool) -> None:
+        if value:
+            self.board.set_kind(self.entity_id, CLOSED_CAN_TILE)
+        else:
+            self.board.set_kind(self.entity_id, OPEN_CAN_TILE)
+
     def get_char(self) -> chr:
         """
         Return 'C' to represent a closed garbage can and 'O' to represent
@@ -1087,6 +1557,15 @@ class GarbageCan(Character):
         return False
 
 
+# The class of the Character behind each kind of entity
+_KIND_CLASSES = {PLAYER_TILE: Player,
+                 RACCOON_TILE: Raccoon,
+                 SMART_RACCOON_TILE: SmartRaccoon,
+                 RECYCLING_BIN_TILE: RecyclingBin,
+                 OPEN_CAN_TILE: GarbageCan,
+                 CLOSED_CAN_TILE: GarbageCan}
+
+
 # A helper function you may find useful for Task #5, depending on how
 # you implement it.
 def get_neighbours(tile: Tuple[int, int]) -> List[Tuple[int, int]]:
@@ -1105,25 +1584,6 @@ def get_neighbours(tile: Tuple[int, int]) -> List[Tuple[int, int]]:
     return rslt
 
 
-def change_next_q(dictionary: dict,
-                  a: RecyclingBin, next_q: list) -> None:
-    """Change the list next_q.
-
-    Precondition: a is in the dictionary.
-    >>> b = GameBoard(5, 5)
-    >>> a_1 = RecyclingBin(b, 1, 2)
-    >>> a_2 = RecyclingBin(b, 1, 1)
-    >>> dictionary_1 = {a_1: [RecyclingBin(b, 1, 1)]}
-    >>> n_lst = []
-    >>> change_next_q(dictionary_1, a_1, n_lst)
-    >>> len(n_lst) == 1
-    True
-    """
-    for m in dictionary[a]:
-        if (m not in dictionary) and (m not in next_q):
-            next_q.append(m)
-
-
 if __name__ == '__main__':
     import doctest
     doctest.testmod()
@@ -1132,7 +1592,8 @@ if __name__ == '__main__':
     python_ta.check_all(config={
         'allowed-io': [],
         'allowed-import-modules': ['doctest', 'python_ta', 'typing',
-                                   'random', '__future__', 'math'],
+                                   'random', '__future__', 'math',
+                                   'Raccoons_Revenge_Index'],
         'disable': ['E1136'],
         'max-attributes': 15,
         'max-module-lines': 1600
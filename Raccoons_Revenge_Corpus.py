@@ -0,0 +1,196 @@
+"""Raccoon Raiders puzzle corpora
+
+=== Module Description ===
+This module contains a binary format for large collections of boards, such
+as hand-made puzzles or generated starting positions, and a reader that
+memory-maps a corpus so that any board in it can be loaded in constant
+time, straight into the internal storage of a GameBoard.
+
+A corpus file holds, in order:
+- HEADER (magic and version)
+- every board: BOARD (its width and height), followed by its tile codes,
+  in the format of GameBoard.tile_codes
+- an index: the offset of every board, followed by TRAILER (the offset of
+  the index, the number of boards and INDEX_MAGIC)
+
+All numbers are little-endian.
+"""
+
+from __future__ import annotations
+
+import mmap
+import random
+import struct
+from array import array
+from typing import BinaryIO, Iterable, Optional, Tuple
+
+import Raccoons_Revenge
+from Raccoons_Revenge_Index import check_tile_codes
+
+MAGIC = b'RRCP'
+INDEX_MAGIC = b'RRIX'
+VERSION = 1
+
+# magic, version
+HEADER = struct.Struct('<4sB')
+
+# width, height
+BOARD = struct.Struct('<II')
+
+# offset of the index, number of boards, INDEX_MAGIC
+TRAILER = struct.Struct('<QI4s')
+
+
+def write_corpus(path: str, grids: Iterable[str]) -> int:
+    """Write a corpus file at <path> holding the boards given by <grids>,
+    in the format of GameBoard.setup_from_grid, and return how many boards
+    were written.
+
+    Raise a ValueError if a grid does not have rows of equal, nonzero
+    length, or holds a character that setup_from_grid does not understand.
+    The file is then left without an index, so CorpusReader rejects it.
+
+    Precondition: every grid has at most one 'P'
+
+    >>> import os, tempfile
+    >>> path = os.path.join(tempfile.mkdtemp(), 'puzzles.rrc')
+    >>> write_corpus(path, ['P-B\\nRC@', 'PRB'])
+    2
+    >>> with CorpusReader(path) as corpus:
+    ...     print(len(corpus), corpus.grid(1))
+    ...     print(corpus.board(0))
+    2 PRB
+    P-B
+    RC@
+    >>> write_corpus(path, ['P-B\\nRC', 'PRB'])
+    Traceback (most recent call last):
+    ...
+    ValueError: the rows of board 0 are not all the same, nonzero length
+    >>> write_corpus(path, ['P-B\\nRX@'])
+    Traceback (most recent call last):
+    ...
+    ValueError: b'X' is not a tile code
+    """
+    offsets = array('Q')
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION))
+        for grid in grids:
+            lines = grid.split('\n')
+            if not lines[0] or any(len(line) != len(lines[0])
+                                   for line in lines):
+                raise ValueError(f'the rows of board {len(offsets)} are not '
+                                 f'all the same, nonzero length')
+            codes = ''.join(lines).encode()
+            check_tile_codes(codes, len(codes))
+            offsets.append(f.tell())
+            f.write(BOARD.pack(len(lines[0]), len(lines)))
+            f.write(codes)
+        index_offset = f.tell()
+        f.write(offsets.tobytes())
+        f.write(TRAILER.pack(index_offset, len(offsets), INDEX_MAGIC))
+    return len(offsets)
+
+
+class CorpusReader:
+    """A reader of a corpus file, which memory-maps the file so that only
+    the boards that are loaded are read.
+    """
+    # === Private Attributes ===
+    # _file:
+    #     the corpus file
+    # _data:
+    #     the memory-mapped contents of the corpus file
+    # _offsets:
+    #     the offset in the file of every board
+    _file: BinaryIO
+    _data: mmap.mmap
+    _offsets: array
+
+    def __init__(self, path: str) -> None:
+        """Initialize this reader to read the corpus file at <path>.
+        """
+        self._file = open(path, 'rb')
+        self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._data) < HEADER.size + TRAILER.size:
+            raise ValueError(f'{path} is not a corpus file')
+        magic, version = HEADER.unpack_from(self._data)
+        index_offset, num_boards, index_magic = TRAILER.unpack_from(
+            self._data, len(self._data) - TRAILER.size)
+        if magic != MAGIC or version != VERSION or index_magic != INDEX_MAGIC:
+            raise ValueError(f'{path} is not a corpus file')
+        self._offsets = array('Q')
+        self._offsets.frombytes(
+            self._data[index_offset:index_offset + 8 * num_boards])
+
+    def __enter__(self) -> CorpusReader:
+        return self
+
+    def __exit__(self, *_: object) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        """Return the number of boards in this corpus.
+        """
+        return len(self._offsets)
+
+    def codes(self, k: int) -> Tuple[int, int, memoryview]:
+        """Return the width, height and tile codes of board <k> of this
+        corpus, as a view into the file.
+
+        Precondition: 0 <= k < len(self)
+        """
+        offset = self._offsets[k]
+        width, height = BOARD.unpack_from(self._data, offset)
+        start = offset + BOARD.size
+        end = start + width * height
+        return width, height, memoryview(self._data)[start:end]
+
+    def grid(self, k: int) -> str:
+        """Return board <k> of this corpus in the format of
+        GameBoard.setup_from_grid.
+
+        Precondition: 0 <= k < len(self)
+        """
+        width, height, codes = self.codes(k)
+        return '\n'.join(bytes(codes[y * width:(y + 1) * width]).decode()
+                         for y in range(height))
+
+    def board(self, k: int,
+              board: Optional[Raccoons_Revenge.GameBoard] = None) \
+            -> Raccoons_Revenge.GameBoard:
+        """Return a board set up as board <k> of this corpus, using
+        GameBoard.setup_from_codes. If <board> is given, it is set up and
+        returned instead of a new board, keeping its random number
+        generator.
+
+        Precondition: 0 <= k < len(self)
+        """
+        width, height, codes = self.codes(k)
+        if board is None:
+            board = Raccoons_Revenge.GameBoard(width, height)
+        board.setup_from_codes(width, height, codes)
+        codes.release()
+        return board
+
+    def random_board(self, rng: Optional[random.Random] = None,
+                     board: Optional[Raccoons_Revenge.GameBoard] = None) \
+            -> Raccoons_Revenge.GameBoard:
+        """Return a board set up as a board of this corpus chosen with <rng>,
+        or with the random module if <rng> is None, as board does.
+
+        Precondition: this corpus is not empty
+        """
+        if rng is None:
+            rng = random
+        return self.board(rng.randrange(len(self)), board)
+
+    def close(self) -> None:
+        """Close the corpus file.
+        """
+        self._data.close()
+        self._file.close()
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
@@ -20,12 +20,14 @@ This module contains the main program that calls upon the classes specified in
 a1.py.
 """
 
+import os
 import sys
-from random import random, shuffle
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 
 import pygame
 import Raccoons_Revenge
+import Raccoons_Revenge_Headless
+import Raccoons_Revenge_Log
 
 # Feel free to modify any of these constant values.
 
@@ -37,15 +39,78 @@ SCREEN_HEIGHT = 600  # 733
 BOARD_WIDTH = 10  # 20
 BOARD_HEIGHT = 10  # 15
 
+# Smallest size in pixels a square is drawn at when the game starts, so that
+# large boards stay readable. Boards that do not fit on the screen at this
+# size are shown through a camera that follows the player.
+MIN_SQUARE_SIZE = 24
+
+# Range of sizes in pixels of a square that zooming in and out goes through.
+# Every zoom step doubles or halves the size.
+MAX_SQUARE_SIZE = 128
+MIN_ZOOM_SQUARE_SIZE = 1
+
+# Smallest size in pixels of a square drawn with icons. When zoomed out
+# further, the board is drawn as a minimap, in which each square of the
+# screen of at least this size shows a block of tiles in one colour.
+MIN_ICON_SIZE = 8
+
+# Number of squares kept between the player and the edge of the screen, where
+# the board is larger than the screen, before the camera moves to put the
+# player back in the middle.
+CAMERA_MARGIN = 2
+
+# The characters a minimap block is shown as, from the one shown first when
+# it is anywhere in the block, and the colour each is shown in
+MINIMAP_PRIORITY = b'PS@ROCB-'
+MINIMAP_COLOURS = {'P': (0, 0, 255),
+                   'S': (200, 0, 0),
+                   '@': (120, 60, 0),
+                   'R': (255, 120, 0),
+                   'O': (0, 200, 0),
+                   'C': (0, 100, 0),
+                   'B': (60, 60, 60),
+                   '-': (230, 230, 230)}
+
+# Colour of the parts of the screen past the edge of the board
+OFF_BOARD_COLOUR = (0, 0, 0)
+
 # Number of each type of Character to include in a random game
 NUM_RACCOONS = 4
 NUM_GARBAGE_CANS = 4
 NUM_RECYCLING_BINS = int(BOARD_HEIGHT * BOARD_WIDTH * 0.25)
 
-# Number of milliseconds to wait between iterations of the main game loop.
-# This changes the speed of the game. The main player can move at most
-# once every LOOP_DELAY milliseconds.
-LOOP_DELAY = 100
+# Number of turns the game is played at per second. This changes the speed
+# of the game. The main player can move at most once a turn.
+TICKS_PER_SECOND = 10
+
+# Number of turns the player gets between raccoon turns.
+RACCOON_TURN_FREQUENCY = Raccoons_Revenge.RACCOON_TURN_FREQUENCY
+
+# Most arrow key presses remembered before the player has moved for them,
+# and most of them the player moves for in a turn.
+INPUT_QUEUE_SIZE = Raccoons_Revenge.INPUT_QUEUE_SIZE
+MOVES_PER_TURN = Raccoons_Revenge.MOVES_PER_TURN
+
+# Number of milliseconds an arrow key has to be held down before the player
+# keeps moving in its direction every turn until it is released.
+KEY_REPEAT_DELAY = 250
+
+# Highest number of times per second the board is drawn.
+FRAMES_PER_SECOND = 60
+
+# Most turns played in a row to catch up when the game falls behind, before
+# the rest of the delay is given up on.
+MAX_CATCH_UP_TICKS = 5
+
+# Number of milliseconds to wait between checks for the window being closed
+# once the game has ended.
+END_SCREEN_DELAY = 500
+
+# Most board states waiting to be printed to the console, and what is done
+# with new ones when the console falls behind: the board printer runs on a
+# background thread, so it never holds up the game.
+LOG_QUEUE_SIZE = Raccoons_Revenge_Log.QUEUE_SIZE
+LOG_POLICY = Raccoons_Revenge_Log.COALESCE
 
 # Fraction of garbage cans that are to be locked at the start of the game.
 FRACTION_LOCKED = 0.1
@@ -63,6 +128,24 @@ RACCOON_ICON = 'icons/raccoon.png'
 RECYCLING_ICON = 'icons/recycling.png'
 RACCOON_IN_BIN_ICON = 'icons/raccoon_in_bin.png'
 
+# The icon of each character, in the order they are laid out in an icon
+# atlas, with the background first
+ATLAS_ICONS = [('-', BACKGROUND_ICON),
+               ('R', RACCOON_ICON),
+               ('S', SMART_RACCOON_ICON),
+               ('C', GARBAGE_CAN_CLOSED_ICON),
+               ('O', GARBAGE_CAN_OPEN_ICON),
+               ('@', RACCOON_IN_BIN_ICON),
+               ('B', RECYCLING_ICON),
+               ('P', PERSON_ICON)]
+
+# Directory where icon atlases are saved, so later launches can load them
+# without scaling the icons again
+ATLAS_CACHE_DIR = 'icons/cache'
+
+# The icon atlases built so far, by square size
+_atlases: Dict[int, Dict[chr, pygame.Surface]] = {}
+
 
 def make_image(icon_file: str, width: int, height: int) -> pygame.surface:
     """
@@ -73,6 +156,74 @@ def make_image(icon_file: str, width: int, height: int) -> pygame.surface:
     return pygame.transform.scale(pic, (width, height))
 
 
+def load_icon_atlas(size: int) -> Dict[chr, pygame.Surface]:
+    """Return the icon of every character in ATLAS_ICONS, scaled to be
+    <size> by <size> and converted to the pixel format of the display, with
+    the background icon under '-'.
+
+    The icons are cut from one atlas image, which is built once per size and
+    saved in ATLAS_CACHE_DIR, so later calls and later launches reuse it
+    instead of loading and scaling every icon again.
+
+    Precondition: the display mode has been set
+    """
+    if size in _atlases:
+        return _atlases[size]
+    path = os.path.join(ATLAS_CACHE_DIR, f'atlas_{size}.png')
+    newest_icon = max(os.path.getmtime(icon) for _, icon in ATLAS_ICONS)
+    if os.path.exists(path) and os.path.getmtime(path) >= newest_icon:
+        sheet = pygame.image.load(path)
+    else:
+        sheet = pygame.Surface((size * len(ATLAS_ICONS), size),
+                               pygame.SRCALPHA)
+        for i, (_, icon) in enumerate(ATLAS_ICONS):
+            sheet.blit(make_image(icon, size, size), (i * size, 0))
+        try:
+            os.makedirs(ATLAS_CACHE_DIR, exist_ok=True)
+            pygame.image.save(sheet, path)
+        except (OSError, pygame.error):
+            pass  # the atlas is only rebuilt next time
+    sheet = sheet.convert_alpha()
+    icons = {}
+    for i, (char, _) in enumerate(ATLAS_ICONS):
+        icons[char] = sheet.subsurface(pygame.Rect(i * size, 0, size, size))
+    # the background covers its whole tile, so it needs no transparency
+    icons['-'] = icons['-'].convert()
+    _atlases[size] = icons
+    return icons
+
+
+def block_code(codes: memoryview, width: int, height: int, x: int, y: int,
+               size: int) -> int:
+    """Return the tile code the minimap shows for the block of <size> by
+    <size> tiles whose top-left tile is (<x>, <y>), out of the tile codes
+    <codes> of a board of width <width> and height <height>, in the format of
+    GameBoard.tile_codes: the code of the character that comes first in
+    MINIMAP_PRIORITY, out of those in the block.
+
+    The part of the block past the edge of the board is left out.
+
+    >>> b = Raccoons_Revenge.GameBoard(4, 3)
+    >>> b.setup_from_grid('P-B-\\n----\\n-R--')
+    >>> codes = b.tile_codes()
+    >>> chr(block_code(codes, 4, 3, 0, 0, 2))
+    'P'
+    >>> chr(block_code(codes, 4, 3, 2, 0, 2))
+    'B'
+    >>> chr(block_code(codes, 4, 3, 0, 2, 2))
+    'R'
+    >>> chr(block_code(codes, 4, 3, 2, 2, 2))
+    '-'
+    """
+    right = min(x + size, width)
+    block = b''.join(codes[row * width + x:row * width + right]
+                     for row in range(y, min(y + size, height)))
+    for code in MINIMAP_PRIORITY:
+        if code in block:
+            return code
+    return MINIMAP_PRIORITY[-1]
+
+
 class RaccoonRaiders:
     """The user interface for the Raccoon Raiders game!
 
@@ -82,7 +233,8 @@ class RaccoonRaiders:
     height:
         height of the underlying game board
     square_size:
-        size of each square in the game
+        size in pixels each tile of the board is drawn at, which is changed
+        by zooming in and out
     """
     # === Private Attributes ===
     # _board:
@@ -93,8 +245,33 @@ class RaccoonRaiders:
     #     the mapping from character (letter) representation to image icons
     # _background_tile:
     #     image icon for the background
-    # _last_state:
-    #     the string representation of the last board state that was drawn
+    # _block:
+    #     the number of tiles across and down each square of the screen shows:
+    #     1 when the board is drawn with icons, and more when it is drawn as
+    #     a minimap
+    # _columns:
+    #     the number of squares across the screen
+    # _rows:
+    #     the number of squares down the screen
+    # _left:
+    #     the x-coordinate of the tile at the left edge of the screen
+    # _top:
+    #     the y-coordinate of the tile at the top edge of the screen
+    # _drawn:
+    #     the tile code drawn in every square of the screen, by row, with 0
+    #     for squares past the edge of the board, or None if the screen has
+    #     to be drawn again from scratch
+    # _minimap:
+    #     the tile code the minimap shows for every block of tiles, by row,
+    #     with 0 for blocks that have not been looked at since they last
+    #     changed
+    # _logger:
+    #     the logger the board is written to every time it is drawn
+    # _held_key:
+    #     the arrow key that was pressed last, if it is still held down, or
+    #     None
+    # _held_since:
+    #     the time in milliseconds when _held_key was pressed
 
     width: int
     height: int
@@ -103,16 +280,33 @@ class RaccoonRaiders:
     _screen: pygame.Surface
     _icon_map: Dict[chr, pygame.Surface]
     _background_tile: pygame.Surface
-    _last_state: Optional[List[List[chr]]]
-
-    def __init__(self, w: int, h: int, board_string: str = "") -> None:
+    _block: int
+    _columns: int
+    _rows: int
+    _left: int
+    _top: int
+    _drawn: Optional[List[List[int]]]
+    _minimap: bytearray
+    _logger: Raccoons_Revenge_Log.BoardLogger
+    _held_key: Optional[int]
+    _held_since: int
+
+    def __init__(self, w: int, h: int, board_string: str = "",
+                 sink: Optional[Raccoons_Revenge_Log.BoardSink] = None) \
+            -> None:
         """Initialize this game to be of the given width <w> and height <h> in
         squares. If <board_string> is not specified, then a random board
         is generated. Otherwise, GameBoard.setup_from_grid is used to populate
         the board.
+
+        The board is written to <sink> every time it is drawn, or printed to
+        the console if <sink> is None.
         """
 
         self._board = Raccoons_Revenge.GameBoard(w, h)
+        self._board.raccoon_turn_frequency = RACCOON_TURN_FREQUENCY
+        self._board.input_queue_size = INPUT_QUEUE_SIZE
+        self._board.moves_per_turn = MOVES_PER_TURN
 
         if board_string:
             self._board.setup_from_grid(board_string)
@@ -122,71 +316,218 @@ class RaccoonRaiders:
                            NUM_GARBAGE_CANS,
                            NUM_RECYCLING_BINS)
 
-        self.square_size = min(int(SCREEN_WIDTH / w),
-                               int(SCREEN_HEIGHT / h))
+        self.height, self.width = self._board.height, self._board.width
+        size = max(min(SCREEN_WIDTH // w, SCREEN_HEIGHT // h),
+                   MIN_SQUARE_SIZE)
 
-        # Initialize a window of these pixel dimensions for display
-        self._screen = pygame.display.set_mode((w * self.square_size,
-                                                h * self.square_size)
+        # Initialize a window of these pixel dimensions for display, or as
+        # much of it as fits on the screen
+        self._screen = pygame.display.set_mode((min(w * size, SCREEN_WIDTH),
+                                                min(h * size, SCREEN_HEIGHT))
                                                )
-
-        # a function defined for convenience that we use to set up the
-        # _icon_map below.
-        def image_loader(x: str) -> pygame.surface:
-            return make_image(x, self.square_size, self.square_size)
-
-        # Initialize the background tile
-        self._background_tile = image_loader(BACKGROUND_ICON)
-
-        self._icon_map = {'R': image_loader(RACCOON_ICON),
-                          'S': image_loader(SMART_RACCOON_ICON),
-                          'C': image_loader(GARBAGE_CAN_CLOSED_ICON),
-                          'O': image_loader(GARBAGE_CAN_OPEN_ICON),
-                          '@': image_loader(RACCOON_IN_BIN_ICON),
-                          'B': image_loader(RECYCLING_ICON),
-                          'P': image_loader(PERSON_ICON)
-                          }
-
-        self._last_state = None
-        self.height, self.width = self._board.height, self._board.width
+        self._left = self._top = 0
+        self.zoom(size)
+
+        if sink is None:
+            sink = Raccoons_Revenge_Log.TextSink()
+        self._logger = Raccoons_Revenge_Log.BoardLogger(sink, LOG_QUEUE_SIZE,
+                                                        LOG_POLICY)
+        self._held_key = None
+        self._held_since = 0
+
+    def zoom(self, size: int) -> None:
+        """Draw each tile of the board <size> pixels across from now on, or
+        as close to that as MIN_ZOOM_SQUARE_SIZE and MAX_SQUARE_SIZE allow.
+
+        Tiles smaller than MIN_ICON_SIZE are drawn as a minimap, in blocks
+        of as many tiles as it takes to fill a square of that size.
+        """
+        self.square_size = min(max(size, MIN_ZOOM_SQUARE_SIZE),
+                               MAX_SQUARE_SIZE)
+        self._block = -(-MIN_ICON_SIZE // self.square_size)
+        cell = self.square_size * self._block
+        screen_width, screen_height = self._screen.get_size()
+        self._columns = -(-screen_width // cell)
+        self._rows = -(-screen_height // cell)
+        if self._block == 1:
+            atlas = load_icon_atlas(self.square_size)
+
+            # Initialize the background tile
+            self._background_tile = atlas['-']
+
+            self._icon_map = {char: icon for char, icon in atlas.items()
+                              if char != '-'}
+        self._minimap = bytearray(-(-self.width // self._block)
+                                  * -(-self.height // self._block))
+        # line the camera up with the blocks of the minimap
+        self._left -= self._left % self._block
+        self._top -= self._top % self._block
+        self._drawn = None
 
     def draw(self) -> None:
         """
-        Draw the given board state using pygame and also print it to the
-        terminal in a text representation.
+        Draw the given board state using pygame and also log it, which
+        prints it to the terminal in a text representation unless another
+        sink was given. Logging happens on a background thread, so drawing
+        never waits for the terminal.
+
+        Only the part of the board that fits on the screen is drawn, around
+        the player, so drawing takes as long on a large board as on a small
+        one. The camera moves when the player comes within CAMERA_MARGIN
+        squares of the edge of the screen, and the whole screen is drawn after
+        it moves or the zoom changes. Otherwise, only the squares showing
+        tiles that have changed since the last draw are redrawn and updated
+        on the screen, and nothing is drawn if none have.
         """
-        state = self._board.to_grid()
-        changed = self._last_state != state
-        if changed:  # also print the board to the console, feel free to remove
-            print(f'\n{self._board}')
-        self._last_state = state
-
-        for x in range(len(state[0])):  # will fail until Task #1 is done
-            for y in range(len(state)):
-                c = state[y][x]
-                rectangle = pygame.Rect(x * self.square_size,
-                                        y * self.square_size,
-                                        self.square_size, self.square_size)
-                # Draw the icon onto the rectangle.
-                self._screen.blit(self._background_tile, (x * self.square_size,
-                                                          y * self.square_size))
-                if c in self._icon_map:
-                    self._screen.blit(self._icon_map[c], rectangle)
-
-        # Update the screen.
-        pygame.display.flip()
+        changed = self._board.changed_tiles()
+        if self._drawn is not None and self._block > 1:
+            blocks_across = -(-self.width // self._block)
+            for x, y in changed:
+                self._minimap[y // self._block * blocks_across
+                              + x // self._block] = 0
+        if self._follow_player() or self._drawn is None:
+            self._logger.log(self._board)
+            self._drawn = [[0] * self._columns for _ in range(self._rows)]
+            for row in range(self._rows):
+                for col in range(self._columns):
+                    code = self._square_code(col, row)
+                    self._drawn[row][col] = code
+                    self._draw_square(col, row, code)
+            # Update the screen.
+            pygame.display.flip()
+            return
+
+        if not changed:
+            return
+        # also log the board, to the console by default
+        self._logger.log(self._board)
+        squares = set()
+        for x, y in changed:
+            col = (x - self._left) // self._block
+            row = (y - self._top) // self._block
+            if 0 <= col < self._columns and 0 <= row < self._rows:
+                squares.add((col, row))
+        rects = []
+        for col, row in squares:
+            code = self._square_code(col, row)
+            if code != self._drawn[row][col]:
+                self._drawn[row][col] = code
+                rects.append(self._draw_square(col, row, code))
+        # Update only the parts of the screen that were drawn on.
+        pygame.display.update(rects)
+
+    def _follow_player(self) -> bool:
+        """Move the camera so that the player is on the screen and at least
+        CAMERA_MARGIN squares from its edge, where the board is larger than the
+        screen, and return whether it moved.
+
+        When the camera has to move, it puts the player in the middle of the
+        screen, as far as the edges of the board allow.
+        """
+        position = self._board.player_position()
+        if position is None:
+            return False
+        left, top = self._left, self._top
+        self._left = self._follow(position[0], self._left, self._columns,
+                                  self.width)
+        self._top = self._follow(position[1], self._top, self._rows,
+                                 self.height)
+        return (left, top) != (self._left, self._top)
+
+    def _follow(self, p: int, start: int, squares: int, length: int) -> int:
+        """Return the tile the camera should start at, along one axis of the
+        board, given that it starts at tile <start> and shows <squares>
+        squares, for the player to be at tile <p>. The board has <length>
+        tiles along this axis.
+        """
+        span = squares * self._block
+        if span >= length:
+            return 0
+        margin = min(CAMERA_MARGIN * self._block, (span - 1) // 2)
+        if start + margin <= p < start + span - margin:
+            return start
+        # the last start, lined up with the blocks, that shows the far edge
+        last = -(-(length - span) // self._block) * self._block
+        start = min(max(p - span // 2, 0), last)
+        return start - start % self._block
+
+    def _square_code(self, col: int, row: int) -> int:
+        """Return the tile code to show in the square in column <col> and
+        row <row> of the screen, or 0 if it is past the edge of the board.
+        """
+        x = self._left + col * self._block
+        y = self._top + row * self._block
+        if not (x < self.width and y < self.height):
+            return 0
+        codes = self._board.tile_codes()
+        if self._block == 1:
+            return codes[y * self.width + x]
+        b = y // self._block * -(-self.width // self._block) + x // self._block
+        if self._minimap[b] == 0:
+            self._minimap[b] = block_code(codes, self.width, self.height,
+                                          x, y, self._block)
+        return self._minimap[b]
+
+    def _draw_square(self, col: int, row: int, code: int) -> pygame.Rect:
+        """Draw the square in column <col> and row <row> of the screen,
+        showing tile code <code>, and return the rectangle of the screen it
+        covers.
+        """
+        cell = self.square_size * self._block
+        rectangle = pygame.Rect(col * cell, row * cell, cell, cell)
+        if code == 0:
+            self._screen.fill(OFF_BOARD_COLOUR, rectangle)
+        elif self._block > 1:
+            self._screen.fill(MINIMAP_COLOURS[chr(code)], rectangle)
+        else:
+            # Draw the icon onto the rectangle.
+            self._screen.blit(self._background_tile, rectangle)
+            c = chr(code)
+            if c in self._icon_map:
+                self._screen.blit(self._icon_map[c], rectangle)
+        return rectangle
 
     def play(self) -> None:
         """
         Play the game!
+
+        Turns are played TICKS_PER_SECOND times a second by the clock,
+        however long drawing takes: when the game falls behind, up to
+        MAX_CATCH_UP_TICKS turns are played before the board is drawn again.
+        The board is drawn at most FRAMES_PER_SECOND times a second, and the
+        loop only sleeps for whatever time is left until the next turn or
+        frame is due.
         """
+        tick_ms = 1000 / TICKS_PER_SECOND
+        frame_ms = 1000 / FRAMES_PER_SECOND
+        self.draw()
+        next_tick = next_frame = pygame.time.get_ticks() + tick_ms
+        undrawn = False  # whether turns were played since the last draw
         while not self._board.ended:
-            pygame.time.wait(LOOP_DELAY)
-            # Handle all inputs that are in the event queue,
-            # i.e., that occurred since the last iteration.
-            self._handle_user_input()
+            now = pygame.time.get_ticks()
+            ticks = 0
+            while now >= next_tick and not self._board.ended:
+                if ticks == MAX_CATCH_UP_TICKS:
+                    # too far behind to catch up, so drop the backlog and
+                    # carry on a whole turn from now
+                    next_tick = now + tick_ms
+                    break
+                self._tick()
+                next_tick += tick_ms
+                ticks += 1
+                undrawn = True
+            if undrawn and now >= next_frame:
+                self.draw()
+                next_frame = now + frame_ms
+                undrawn = False
+            wake = min(next_tick, next_frame) if undrawn else next_tick
+            delay = wake - pygame.time.get_ticks()
+            if delay > 0:
+                pygame.time.wait(int(delay))
+        self.draw()
 
-        # game has ended, print message
+        # game has ended, print message once the board log has caught up
+        self._logger.close()
         score = self._board.check_game_end()
         print(f"Game has ended. Your score is {score}")
 
@@ -195,42 +536,76 @@ class RaccoonRaiders:
         # now print the text
         text_surface = font.render(f"Your Score: {score}",
                                    False, (0, 0, 0))
-        self._screen.blit(text_surface, dest=(0,
-                                              (self.square_size
-                                               * self.height) // 2))
+        self._screen.blit(text_surface,
+                          dest=(0, self._screen.get_height() // 2))
         pygame.display.flip()
         # Keep the screen on after the game has ended. You need to
         # close the pygame window to end the program.
         while True:
-            pygame.time.wait(LOOP_DELAY * 5)
+            pygame.time.wait(END_SCREEN_DELAY)
             for event in pygame.event.get():
                 # Stop if user closed the window.
                 if event.type == pygame.constants.QUIT:
                     sys.exit()
 
+    def _tick(self) -> None:
+        """Play one turn: handle user input, then give characters their
+        turns.
+        """
+        # Handle all inputs that are in the event queue,
+        # i.e., that occurred since the last turn.
+        self._handle_user_input()
+        # Give every character a turn in the game.
+        self._board.give_turns()
+
     def _handle_user_input(self) -> None:
-        """Handle user input, give characters their turns, and
-        redraw the game board.
+        """Handle user input, passing every arrow key press on to the board,
+        in order, to be queued for the player.
+
+        Once the last arrow key pressed has been held down for
+        KEY_REPEAT_DELAY milliseconds, its direction is passed on again
+        whenever the player has no moves left to make, so holding a key
+        moves the player once a turn without queuing up moves.
+
+        The + (or =) and - keys zoom in and out.
         """
         for event in pygame.event.get():  # process all key presses
             # Stop if user closed the window.
             if event.type == pygame.constants.QUIT:
                 sys.exit()
             if event.type == pygame.constants.KEYDOWN:
-                dx, dy = None, None
-                if event.key == pygame.constants.K_DOWN:
-                    dx, dy = 0, 1
-                if event.key == pygame.constants.K_LEFT:
-                    dx, dy = -1, 0
-                if event.key == pygame.constants.K_RIGHT:
-                    dx, dy = 1, 0
-                if event.key == pygame.constants.K_UP:
-                    dx, dy = 0, -1
-                if dx is not None:
-                    self._board.handle_event((dx, dy))
-        # Give every character a turn in the game and draw the board.
-        self._board.give_turns()
-        self.draw()
+                direction = _key_direction(event.key)
+                if direction is not None:
+                    self._board.handle_event(direction)
+                    self._held_key = event.key
+                    self._held_since = pygame.time.get_ticks()
+                elif event.key in (pygame.constants.K_EQUALS,
+                                   pygame.constants.K_PLUS):
+                    self.zoom(self.square_size * 2)
+                elif event.key == pygame.constants.K_MINUS:
+                    self.zoom(self.square_size // 2)
+            if event.type == pygame.constants.KEYUP \
+                    and event.key == self._held_key:
+                self._held_key = None
+        if self._held_key is not None and self._board.pending_events() == 0 \
+                and pygame.time.get_ticks() - self._held_since \
+                >= KEY_REPEAT_DELAY:
+            self._board.handle_event(_key_direction(self._held_key))
+
+
+def _key_direction(key: int) -> Optional[Tuple[int, int]]:
+    """Return the direction the arrow key <key> stands for, or None if <key>
+    is not an arrow key.
+    """
+    if key == pygame.constants.K_DOWN:
+        return 0, 1
+    if key == pygame.constants.K_LEFT:
+        return -1, 0
+    if key == pygame.constants.K_RIGHT:
+        return 1, 0
+    if key == pygame.constants.K_UP:
+        return 0, -1
+    return None
 
 
 # this depends on your place_character method in the GameBoard class
@@ -256,38 +631,14 @@ def populate_board(board: Raccoons_Revenge.GameBoard, num_raccoons: int,
           on the board!
         - board is initially empty
 
-    >>> b = a1.GameBoard(3, 1)
+    >>> b = Raccoons_Revenge.GameBoard(3, 1)
     >>> populate_board(b,1,0,1)
     >>> str(b) in ['PRB', 'PBR', 'PSB', 'PBS']
     True
     """
-    Raccoons_Revenge.Player(board, 0, 0)
-
-    # get the set of all possible locations on the board and
-    # randomly place characters in them.
-    availables = []
-    for i in range(board.width):
-        for j in range(board.height):
-            availables.append((i, j))
-    availables.remove((0, 0))
-
-    shuffle(availables)
-
-    for _ in range(num_raccoons):
-        x, y = availables.pop()
-        if random() <= FRACTION_SMART:
-            Raccoons_Revenge.SmartRaccoon(board, x, y)
-        else:
-            Raccoons_Revenge.Raccoon(board, x, y)
-
-    for _ in range(num_cans):
-        x, y = availables.pop()
-        locked = random() <= FRACTION_LOCKED
-        Raccoons_Revenge.GarbageCan(board, x, y, locked)
-
-    for _ in range(num_bins):
-        x, y = availables.pop()
-        Raccoons_Revenge.RecyclingBin(board, x, y)
+    Raccoons_Revenge_Headless.populate_board(board, num_raccoons, num_cans,
+                                             num_bins, FRACTION_LOCKED,
+                                             FRACTION_SMART)
 
 
 if __name__ == '__main__':
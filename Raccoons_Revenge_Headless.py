@@ -0,0 +1,489 @@
+"""Raccoon Raiders without a display
+
+=== Module Description ===
+This module contains a runner for the Raccoon Raiders game that does not
+depend on pygame, so that games can be generated and played to completion
+as fast as possible, for example on servers with no display. Player input
+comes from a controller: a function that is given the board before every
+turn and returns the direction the Player should move in, if any.
+"""
+
+from __future__ import annotations
+
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Iterable, Iterator, List, NamedTuple, \
+    Optional, Sequence, Tuple
+
+import Raccoons_Revenge
+
+# Default number of each type of Character to include in a random game
+NUM_RACCOONS = 4
+NUM_GARBAGE_CANS = 4
+
+# Default fraction of the board covered by recycling bins in a random game
+FRACTION_RECYCLING_BINS = 0.25
+
+# Default fraction of garbage cans that are to be locked at the start of the
+# game.
+FRACTION_LOCKED = 0.1
+
+# Default fraction of "smart" raccoons
+FRACTION_SMART = 0.5
+
+# Default number of turns after which a game that has not ended is given up
+MAX_TURNS = 10000
+
+# The tile codes shown by each plane of a RaccoonEnv observation, in order
+PLANES = [Raccoons_Revenge.PLAYER_TILE, Raccoons_Revenge.RACCOON_TILE,
+          Raccoons_Revenge.SMART_RACCOON_TILE, Raccoons_Revenge.OPEN_CAN_TILE,
+          Raccoons_Revenge.CLOSED_CAN_TILE,
+          Raccoons_Revenge.RECYCLING_BIN_TILE,
+          Raccoons_Revenge.RACCOON_IN_CAN_TILE]
+
+# For each plane, a bytes.translate table mapping its tile code to 1 and
+# every other code to 0
+_PLANE_TABLES = [bytes(int(code == plane) for code in range(256))
+                 for plane in PLANES]
+
+# The moves a RaccoonEnv action can stand for: an index into DIRECTIONS, or
+# len(DIRECTIONS) to stand still
+ACTIONS = Raccoons_Revenge.DIRECTIONS + [None]
+
+# A controller is given the board before every turn and returns the
+# direction the Player should move in, or None to stand still.
+Controller = Callable[[Raccoons_Revenge.GameBoard],
+                      Optional[Tuple[int, int]]]
+
+
+def populate_board(board: Raccoons_Revenge.GameBoard, num_raccoons: int,
+                   num_cans: int, num_bins: int,
+                   fraction_locked: float = FRACTION_LOCKED,
+                   fraction_smart: float = FRACTION_SMART,
+                   rng: Optional[random.Random] = None) -> None:
+    """Place characters on this board.
+
+    The board will have one player at the top-left corner of the board,
+    and the given number of raccoons, garbage cans and recycling bins
+    all at random, not already occupied, locations on the board.
+
+    <fraction_locked> and <fraction_smart> dictate the probability that
+    each GarbageCan is locked and
+    each Raccoon is a SmartRaccoon, respectively.
+
+    Random choices are made with <rng>, or with the rng of <board> if <rng>
+    is None.
+
+    Precondition:
+        - num_raccoons >= 0
+        - num_cans >= 0
+        - num_bins >= 0
+        - num_raccoons + num_bins + num_cans + 1 <= number of locations
+          on the board!
+        - board is initially empty
+
+    >>> b = Raccoons_Revenge.GameBoard(3, 1)
+    >>> populate_board(b, 1, 0, 1)
+    >>> str(b) in ['PRB', 'PBR', 'PSB', 'PBS']
+    True
+    """
+    if rng is None:
+        rng = board.rng
+    Raccoons_Revenge.Player(board, 0, 0)
+
+    # get the set of all possible locations on the board and
+    # randomly place characters in them.
+    availables = []
+    for i in range(board.width):
+        for j in range(board.height):
+            availables.append((i, j))
+    availables.remove((0, 0))
+
+    rng.shuffle(availables)
+
+    for _ in range(num_raccoons):
+        x, y = availables.pop()
+        if rng.random() <= fraction_smart:
+            Raccoons_Revenge.SmartRaccoon(board, x, y)
+        else:
+            Raccoons_Revenge.Raccoon(board, x, y)
+
+    for _ in range(num_cans):
+        x, y = availables.pop()
+        locked = rng.random() <= fraction_locked
+        Raccoons_Revenge.GarbageCan(board, x, y, locked)
+
+    for _ in range(num_bins):
+        x, y = availables.pop()
+        Raccoons_Revenge.RecyclingBin(board, x, y)
+
+
+def random_board(w: int, h: int, num_raccoons: int = NUM_RACCOONS,
+                 num_cans: int = NUM_GARBAGE_CANS,
+                 num_bins: Optional[int] = None,
+                 fraction_locked: float = FRACTION_LOCKED,
+                 fraction_smart: float = FRACTION_SMART,
+                 seed: Optional[int] = None) -> Raccoons_Revenge.GameBoard:
+    """Return a new <w> by <h> board with its random number generator
+    seeded with <seed>, populated by populate_board using that generator.
+
+    If <num_bins> is None, FRACTION_RECYCLING_BINS of the board is covered
+    by recycling bins.
+
+    >>> b = random_board(10, 10)
+    >>> b.width, b.height, str(b).count('B')
+    (10, 10, 25)
+    >>> str(random_board(10, 10, seed=1)) == str(random_board(10, 10, seed=1))
+    True
+    """
+    if num_bins is None:
+        num_bins = int(w * h * FRACTION_RECYCLING_BINS)
+    board = Raccoons_Revenge.GameBoard(w, h, seed)
+    populate_board(board, num_raccoons, num_cans, num_bins,
+                   fraction_locked, fraction_smart)
+    return board
+
+
+def scripted(moves: Iterable[Optional[Tuple[int, int]]]) -> Controller:
+    """Return a controller that makes the given <moves>, one per turn, and
+    stands still once they run out.
+
+    >>> controller = scripted([Raccoons_Revenge.RIGHT, None])
+    >>> b = Raccoons_Revenge.GameBoard(1, 1)
+    >>> controller(b), controller(b), controller(b)
+    ((1, 0), None, None)
+    """
+    it = iter(moves)
+
+    def controller(_: Raccoons_Revenge.GameBoard) -> Optional[Tuple[int, int]]:
+        return next(it, None)
+    return controller
+
+
+def random_player(rng: Optional[random.Random] = None) -> Controller:
+    """Return a controller that moves in a random direction every turn,
+    choosing with <rng>, or with the random module if <rng> is None.
+    """
+    if rng is None:
+        rng = random
+
+    def controller(_: Raccoons_Revenge.GameBoard) -> Optional[Tuple[int, int]]:
+        return rng.choice(Raccoons_Revenge.DIRECTIONS)
+    return controller
+
+
+class HeadlessRaiders:
+    """A game of Raccoon Raiders with no user interface, where the Player is
+    moved by a controller.
+
+    === Public Attributes ===
+    board:
+        the board containing the state of the game
+    moves:
+        the move the controller chose in each turn played so far, which
+        together with the seed of the board is enough to replay the game
+
+    === Sample Usage ===
+    >>> game = HeadlessRaiders(Raccoons_Revenge.GameBoard(1, 1),
+    ...                        scripted([Raccoons_Revenge.LEFT]))
+    >>> game.board.setup_from_grid('PRB\\nBB-')
+    >>> game.play(max_turns=100)
+    12
+    >>> game.board.turns, game.moves
+    (1, [(-1, 0)])
+    """
+    # === Private Attributes ===
+    # _controller:
+    #     the controller that chooses the Player's moves
+    board: Raccoons_Revenge.GameBoard
+    moves: List[Optional[Tuple[int, int]]]
+    _controller: Controller
+
+    def __init__(self, board: Raccoons_Revenge.GameBoard,
+                 controller: Controller) -> None:
+        """Initialize this game to be played on <board>, with the Player
+        moved by <controller>.
+        """
+        self.board = board
+        self.moves = []
+        self._controller = controller
+
+    def step(self) -> None:
+        """Play one turn of the game: ask the controller for the Player's
+        move, then give every character a turn.
+
+        Precondition: the board has a Player
+        """
+        direction = self._controller(self.board)
+        self.moves.append(direction)
+        if direction is not None:
+            self.board.handle_event(direction)
+        self.board.give_turns()
+
+    def play(self, max_turns: Optional[int] = None) -> Optional[int]:
+        """Play turns until the game ends or <max_turns> turns have been
+        played, and return the score, or None if the game did not end.
+
+        Precondition: the board has a Player
+        """
+        turns = 0
+        while not self.board.ended and (max_turns is None
+                                        or turns < max_turns):
+            self.step()
+            turns += 1
+        if not self.board.ended:
+            return None
+        return self.board.check_game_end()
+
+
+class RaccoonEnv:
+    """A reinforcement learning environment for Raccoon Raiders, played on
+    random boards, in the style of OpenAI Gym.
+
+    Observations are len(PLANES) one-hot planes, one per tile code in
+    PLANES, each holding a 1 for every tile with that code and a 0
+    elsewhere, as a memoryview of bytes with shape
+    (len(PLANES), height, width). The same buffer is refilled by every call
+    to reset and step, so copy an observation to keep it.
+
+    Actions are indexes into ACTIONS. The reward is the score of the game on
+    the step it ends, and 0 otherwise.
+
+    === Public Attributes ===
+    board:
+        the board of the current episode
+    max_turns:
+        the number of turns after which an episode that has not ended is
+        cut short
+
+    === Sample Usage ===
+    >>> env = RaccoonEnv(3, 1, 1, 0, 1, seed=2)
+    >>> obs = env.reset()
+    >>> obs.shape
+    (7, 1, 3)
+    >>> str(env.board)
+    'PBR'
+    >>> obs.tolist()
+    [[[1, 0, 0]], [[0, 0, 1]], [[0, 0, 0]], [[0, 0, 0]], [[0, 0, 0]], \
+[[0, 1, 0]], [[0, 0, 0]]]
+    >>> obs, reward, done, info = env.step(4)
+    >>> reward, done, info
+    (11, True, {'turns': 1})
+    """
+    # === Private Attributes ===
+    # _settings:
+    #     the arguments random_board is given to make each board, after the
+    #     board size
+    # _rng:
+    #     the random number generator used to make boards
+    # _planes:
+    #     the buffer holding the observation planes
+    # _observation:
+    #     the view of _planes that is returned as the observation
+    board: Raccoons_Revenge.GameBoard
+    max_turns: int
+    _settings: tuple
+    _rng: random.Random
+    _planes: bytearray
+    _observation: memoryview
+
+    def __init__(self, w: int, h: int, num_raccoons: int = NUM_RACCOONS,
+                 num_cans: int = NUM_GARBAGE_CANS,
+                 num_bins: Optional[int] = None,
+                 fraction_locked: float = FRACTION_LOCKED,
+                 fraction_smart: float = FRACTION_SMART,
+                 max_turns: int = MAX_TURNS,
+                 seed: Optional[int] = None) -> None:
+        """Initialize this environment to play episodes on random <w> by <h>
+        boards made by random_board with the given settings, generated from
+        <seed>.
+        """
+        self._settings = (num_raccoons, num_cans, num_bins, fraction_locked,
+                          fraction_smart)
+        self.max_turns = max_turns
+        self._rng = random.Random(seed)
+        self.board = Raccoons_Revenge.GameBoard(w, h)
+        self._planes = bytearray(len(PLANES) * w * h)
+        self._observation = memoryview(self._planes).toreadonly().cast(
+            'B', (len(PLANES), h, w))
+
+    def reset(self) -> memoryview:
+        """Start a new episode on a new random board and return the first
+        observation.
+        """
+        self.board = random_board(self.board.width, self.board.height,
+                                  *self._settings,
+                                  seed=self._rng.getrandbits(64))
+        return self._observe()
+
+    def step(self, action: int) -> Tuple[memoryview, int, bool, dict]:
+        """Play one turn with the Player making the move ACTIONS[<action>],
+        and return the observation, the reward, whether the episode is over,
+        and a dictionary of extra information.
+
+        Precondition: reset has been called, and the episode is not over
+        """
+        direction = ACTIONS[action]
+        if direction is not None:
+            self.board.handle_event(direction)
+        self.board.give_turns()
+        reward = 0
+        if self.board.ended:
+            reward = self.board.check_game_end()
+        done = self.board.ended or self.board.turns >= self.max_turns
+        return self._observe(), reward, done, {'turns': self.board.turns}
+
+    def _observe(self) -> memoryview:
+        """Fill the observation planes from the tile codes of the board and
+        return the observation.
+        """
+        codes = self.board.tile_codes().tobytes()
+        n = len(codes)
+        for k, table in enumerate(_PLANE_TABLES):
+            self._planes[k * n:(k + 1) * n] = codes.translate(table)
+        return self._observation
+
+
+class GameResult(NamedTuple):
+    """The outcome of one game played by play_game.
+
+    seed:
+        the seed the game was played with
+    score:
+        the score of the game, or None if it did not end
+    turns:
+        the number of turns that were played
+    trapped:
+        the number of raccoons trapped at the end of the game
+    inside:
+        the number of raccoons inside a garbage can at the end of the game
+    """
+    seed: int
+    score: Optional[int]
+    turns: int
+    trapped: int
+    inside: int
+
+
+def play_game(seed: int, w: int, h: int,
+              num_raccoons: int = NUM_RACCOONS,
+              num_cans: int = NUM_GARBAGE_CANS,
+              num_bins: Optional[int] = None,
+              fraction_locked: float = FRACTION_LOCKED,
+              fraction_smart: float = FRACTION_SMART,
+              max_turns: int = MAX_TURNS,
+              moves: Optional[Sequence[Tuple[int, int]]] = None) \
+        -> GameResult:
+    """Play one game on a random <w> by <h> board and return its result.
+
+    The board is generated and played with its random number generator
+    seeded with <seed>, so the same arguments always give the same result.
+    The Player makes the given <moves> if they are not None, and otherwise
+    moves at random, with a separate generator seeded with <seed> so that
+    the game can be replayed from its moves.
+
+    >>> play_game(1, 3, 1, 1, 0, 1, moves=[]) == \\
+    ...     play_game(1, 3, 1, 1, 0, 1, moves=[])
+    True
+    >>> play_game(7, 1, 2, 1, 0, 0, moves=[])
+    GameResult(seed=7, score=10, turns=1, trapped=1, inside=0)
+    """
+    board = random_board(w, h, num_raccoons, num_cans, num_bins,
+                         fraction_locked, fraction_smart, seed)
+    if moves is None:
+        controller = random_player(random.Random(seed))
+    else:
+        controller = scripted(moves)
+    score = HeadlessRaiders(board, controller).play(max_turns)
+    trapped, inside = board.raccoon_counts()
+    return GameResult(seed, score, board.turns, trapped, inside)
+
+
+def replay(seed: int, w: int, h: int,
+           moves: Sequence[Optional[Tuple[int, int]]],
+           turn: Optional[int] = None,
+           num_raccoons: int = NUM_RACCOONS,
+           num_cans: int = NUM_GARBAGE_CANS,
+           num_bins: Optional[int] = None,
+           fraction_locked: float = FRACTION_LOCKED,
+           fraction_smart: float = FRACTION_SMART) \
+        -> Raccoons_Revenge.GameBoard:
+    """Return the board of the game on the random <w> by <h> board made from
+    <seed> with the given settings, as it is after <turn> turns in which the
+    Player made the given <moves>, or after all of <moves> if <turn> is None.
+
+    The game stops early if it ends. This replays any game played by
+    play_game or by a HeadlessRaiders on a board from random_board, given
+    its seed and the moves it recorded.
+
+    >>> game = HeadlessRaiders(random_board(8, 8, seed=3),
+    ...                        random_player(random.Random(3)))
+    >>> _ = game.play(max_turns=200)
+    >>> board = replay(3, 8, 8, game.moves)
+    >>> str(board) == str(game.board), board.turns == game.board.turns
+    (True, True)
+    >>> replay(3, 8, 8, game.moves, 10).turns
+    10
+    """
+    board = random_board(w, h, num_raccoons, num_cans, num_bins,
+                         fraction_locked, fraction_smart, seed)
+    if turn is None:
+        turn = len(moves)
+    HeadlessRaiders(board, scripted(moves)).play(turn)
+    return board
+
+
+def _play_seeded(args: Tuple[int, tuple]) -> GameResult:
+    """Play the game with the seed and play_game arguments in <args>.
+    """
+    seed, settings = args
+    return play_game(seed, *settings)
+
+
+def run_tournament(num_games: int, w: int, h: int, seed: int = 0,
+                   num_raccoons: int = NUM_RACCOONS,
+                   num_cans: int = NUM_GARBAGE_CANS,
+                   num_bins: Optional[int] = None,
+                   fraction_locked: float = FRACTION_LOCKED,
+                   fraction_smart: float = FRACTION_SMART,
+                   max_turns: int = MAX_TURNS,
+                   moves: Optional[Sequence[Tuple[int, int]]] = None,
+                   max_workers: Optional[int] = None) -> Iterator[GameResult]:
+    """Play <num_games> games with play_game across a pool of <max_workers>
+    processes, and yield their results in the order the games were handed
+    out, each once it and every game before it have finished.
+
+    Each game gets its own seed drawn from <seed>, so a tournament gives the
+    same results however many workers play it. The other arguments are
+    passed on to play_game.
+
+    >>> results = list(run_tournament(4, 3, 1, 5, 1, 0, 1, moves=[],
+    ...                               max_workers=2))
+    >>> [r.turns for r in results]
+    [1, 1, 1, 1]
+    >>> results == list(run_tournament(4, 3, 1, 5, 1, 0, 1, moves=[],
+    ...                                max_workers=1))
+    True
+    """
+    rng = random.Random(seed)
+    settings = (w, h, num_raccoons, num_cans, num_bins, fraction_locked,
+                fraction_smart, max_turns, moves)
+    jobs = [(rng.getrandbits(64), settings) for _ in range(num_games)]
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    # hand out games in chunks so that short games are not dominated by the
+    # cost of sending them to a worker
+    chunksize = max(1, num_games // (4 * max_workers))
+    with ProcessPoolExecutor(max_workers) as executor:
+        yield from executor.map(_play_seeded, jobs, chunksize=chunksize)
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
+
+    ended = [result for result in run_tournament(100, 10, 10)
+             if result.score is not None]
+    print(f"{len(ended)} of 100 games ended, with an average score of "
+          f"{sum(result.score for result in ended) / max(1, len(ended))}")
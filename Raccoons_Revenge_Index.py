@@ -0,0 +1,1295 @@
+"""Raccoon Raiders board storage
+
+=== Module Description ===
+This module contains the storage behind a GameBoard in Raccoons_Revenge:
+
+- a TileIndex, which holds the tile code of every tile, so that the board
+  can answer questions about its tiles without walking over them
+- an EntityStore, which holds the state of every character on the board,
+  and which tile each of them is on
+- a Journal, which records the changes made to the board turn by turn, so
+  that turns can be taken back and made again
+
+GameBoard keeps one of each, so that its own methods can be about the rules
+of the game.
+"""
+
+from __future__ import annotations
+
+import random
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+# Tile codes, as used by to_grid and setup_from_grid
+EMPTY_TILE = ord('-')
+PLAYER_TILE = ord('P')
+RACCOON_TILE = ord('R')
+SMART_RACCOON_TILE = ord('S')
+CLOSED_CAN_TILE = ord('C')
+OPEN_CAN_TILE = ord('O')
+RECYCLING_BIN_TILE = ord('B')
+RACCOON_IN_CAN_TILE = ord('@')
+
+# The tile codes of tiles that a Raccoon is not blocked by
+OPEN_TO_RACCOONS = (EMPTY_TILE, OPEN_CAN_TILE, CLOSED_CAN_TILE)
+
+# Entries of EntityStore.occupants for an empty tile and for a tile that
+# holds more than one character
+NO_ENTITY = -1
+STACKED = -2
+
+# Maps each tile code to 1 if a Raccoon is not blocked by it, and 0 otherwise,
+# for use with bytes.translate
+_OPEN_TABLE = bytes(int(code in OPEN_TO_RACCOONS) for code in range(256))
+
+# Maps every byte to 1 if it is not zero, and to 0 if it is
+_NONZERO = bytes([0] + [1] * 255)
+
+# The tile codes of tiles that have a Raccoon on them
+_RACCOON_TILES = (RACCOON_TILE, SMART_RACCOON_TILE, RACCOON_IN_CAN_TILE)
+
+# The four tiles beside a tile, as dx, dy, in the order of DIRECTIONS in
+# Raccoons_Revenge: left, up, right and down
+_BESIDE = [(-1, 0), (0, -1), (1, 0), (0, 1)]
+
+# A tile itself and the tiles beside it, as dx, dy
+_SELF_AND_BESIDE = [(0, 0)] + _BESIDE
+
+# The eight tiles around a tile, in order around it, starting from the tile
+# to its left so that the tiles beside it come at even positions
+_RING = [(-1, 0), (-1, -1), (0, -1), (1, -1), (1, 0), (1, 1), (0, 1), (-1, 1)]
+
+# The rank of each kind of entity among the entities sharing a tile, indexed
+# by kind: the player comes first, then raccoons, recycling bins and
+# garbage cans.
+_STACK_RANKS = bytearray(256)
+_STACK_RANKS[RACCOON_TILE] = _STACK_RANKS[SMART_RACCOON_TILE] = 1
+_STACK_RANKS[RECYCLING_BIN_TILE] = 2
+_STACK_RANKS[OPEN_CAN_TILE] = _STACK_RANKS[CLOSED_CAN_TILE] = 3
+
+# Zobrist hashing: every tile code that can be shown on a tile gets a random
+# 64-bit key per tile index, and a board hashes to the XOR of the keys of
+# its tiles. The key of tile code c on the tile at index t is
+# _ZOBRIST_KEYS[t * _NUM_TILE_CODES + _ZOBRIST_INDEX[c]], and is 0 for an
+# empty tile. Keys come from a fixed seed, so equal boards of the same size
+# always hash alike, and are generated as larger boards need them.
+_TILE_CODES = (EMPTY_TILE, PLAYER_TILE, RACCOON_TILE, SMART_RACCOON_TILE,
+               CLOSED_CAN_TILE, OPEN_CAN_TILE, RECYCLING_BIN_TILE,
+               RACCOON_IN_CAN_TILE)
+_NUM_TILE_CODES = len(_TILE_CODES)
+_ZOBRIST_INDEX = bytearray(_TILE_CODES.index(c) if c in _TILE_CODES else 0
+                           for c in range(256))
+_ZOBRIST_KEYS = array('Q')
+_ZOBRIST_RNG = random.Random(148)
+
+
+def _extend_zobrist_keys(n: int) -> None:
+    """Make sure _ZOBRIST_KEYS has keys for at least <n> tiles.
+    """
+    while len(_ZOBRIST_KEYS) < n * _NUM_TILE_CODES:
+        _ZOBRIST_KEYS.append(0)  # the key of an empty tile
+        for _ in range(_NUM_TILE_CODES - 1):
+            _ZOBRIST_KEYS.append(_ZOBRIST_RNG.getrandbits(64))
+
+
+def changed_indices(old: bytes, new: bytes) -> List[int]:
+    """Return the indexes at which the byte strings <old> and <new> differ,
+    in increasing order. This takes time linear in their length, with the
+    comparison done on whole integers, so it only loops in Python once for
+    each difference.
+
+    Precondition: len(old) == len(new)
+
+    >>> changed_indices(bytearray(b'P-R-'), bytearray(b'-PR@'))
+    [0, 1, 3]
+    >>> changed_indices(b'', b'')
+    []
+    """
+    diff = int.from_bytes(old, 'little') ^ int.from_bytes(new, 'little')
+    flags = diff.to_bytes(len(old), 'little').translate(_NONZERO)
+    indices = []
+    t = flags.find(1)
+    while t != -1:
+        indices.append(t)
+        t = flags.find(1, t + 1)
+    return indices
+
+
+def check_tile_codes(codes: bytes, size: int) -> None:
+    """Raise a ValueError unless <codes> is <size> bytes long and every byte
+    of it is one of the tile codes.
+
+    >>> check_tile_codes(b'P-B@', 4)
+    >>> check_tile_codes(b'P-B@', 6)
+    Traceback (most recent call last):
+    ...
+    ValueError: expected 6 tile codes, got 4
+    >>> check_tile_codes(b'P-X@', 4)
+    Traceback (most recent call last):
+    ...
+    ValueError: b'X' is not a tile code
+    """
+    if len(codes) != size:
+        raise ValueError(f'expected {size} tile codes, got {len(codes)}')
+    others = bytes(codes).translate(None, bytes(_TILE_CODES))
+    if others:
+        raise ValueError(f'{others[:1]!r} is not a tile code')
+
+
+class TileIndex:
+    """The tile code of every tile of a board, together with what is kept up
+    to date from them as they change.
+
+    Tiles are given either by their coordinates (x, y) or by their index
+    y * width + x in the tile codes.
+
+    === Public Attributes ===
+    width:
+        the number of tiles across the board
+    height:
+        the number of tiles down the board
+    codes:
+        the tile code of every tile, one byte per tile in row-major order,
+        so the code of tile (x, y) is at y * width + x. Every change to it
+        goes through set_code or fill.
+    hash:
+        the Zobrist hash of codes
+
+    === Private Attributes ===
+    _dirty:
+        for each tile whose tile code has been changed since the last call
+        to changed_tiles, the tile code it had at that call
+    _text:
+        the string representation of the board, or None if the tile codes
+        have changed since it was last computed
+    _clusters:
+        the clusters of adjacent recycling bins
+    _row_stops:
+        for each row, the sorted x coordinates of its non-empty tiles
+    _col_stops:
+        for each column, the sorted y coordinates of its non-empty tiles
+    _row_runs:
+        the runs of recycling bins along each row
+    _col_runs:
+        the runs of recycling bins along each column
+
+    === Sample Usage ===
+    >>> tiles = TileIndex(3, 2)
+    >>> tiles.set_code(4, RECYCLING_BIN_TILE)
+    >>> tiles.text()
+    '---\\n-B-'
+    >>> tiles.code(1, 1) == RECYCLING_BIN_TILE, tiles.code(3, 1)
+    (True, None)
+    >>> tiles.changed_tiles()
+    {(1, 1)}
+    """
+    width: int
+    height: int
+    codes: bytearray
+    hash: int
+    _dirty: Dict[int, int]
+    _text: Optional[str]
+    _clusters: BinClusters
+    _row_stops: List[List[int]]
+    _col_stops: List[List[int]]
+    _row_runs: List[BinRuns]
+    _col_runs: List[BinRuns]
+
+    def __init__(self, w: int, h: int) -> None:
+        """Initialize the index of a <w> by <h> board with no characters.
+        """
+        self.width = w
+        self.height = h
+        self.codes = bytearray([EMPTY_TILE]) * (w * h)
+        self.hash = 0
+        _extend_zobrist_keys(w * h)
+        self._dirty = {}
+        self._text = None
+        self._clusters = BinClusters(w, h)
+        self._row_stops = [[] for _ in range(h)]
+        self._col_stops = [[] for _ in range(w)]
+        self._row_runs = [BinRuns() for _ in range(h)]
+        self._col_runs = [BinRuns() for _ in range(w)]
+
+    def copy(self) -> TileIndex:
+        """Return an independent copy of this index.
+        """
+        other = TileIndex(0, 0)
+        other.width, other.height = self.width, self.height
+        other.codes = self.codes[:]
+        other.hash = self.hash
+        other._dirty = self._dirty.copy()
+        other._text = self._text
+        other._clusters = self._clusters.copy()
+        other._row_stops = [stops[:] for stops in self._row_stops]
+        other._col_stops = [stops[:] for stops in self._col_stops]
+        other._row_runs = [runs.copy() for runs in self._row_runs]
+        other._col_runs = [runs.copy() for runs in self._col_runs]
+        return other
+
+    def index(self, x: int, y: int) -> Optional[int]:
+        """Return the index of tile (x, y), or None if it is not on the
+        board.
+        """
+        if 0 <= x < self.width and 0 <= y < self.height:
+            return y * self.width + x
+        return None
+
+    def code(self, x: int, y: int) -> Optional[int]:
+        """Return the tile code of tile (x, y), or None if it is not on the
+        board.
+        """
+        if 0 <= x < self.width and 0 <= y < self.height:
+            return self.codes[y * self.width + x]
+        return None
+
+    def set_code(self, t: int, code: int) -> None:
+        """Set the tile code of the tile at index <t> to <code>.
+
+        Every change to a tile code goes through this method, which keeps
+        track of the changed tiles, the string representation, the Zobrist
+        hash, the clusters and runs of recycling bins, and the non-empty
+        tiles of each row and column.
+        """
+        old = self.codes[t]
+        if old != code:
+            self._dirty.setdefault(t, old)
+            self.codes[t] = code
+            self._text = None
+            base = t * _NUM_TILE_CODES
+            self.hash ^= _ZOBRIST_KEYS[base + _ZOBRIST_INDEX[old]] ^ \
+                _ZOBRIST_KEYS[base + _ZOBRIST_INDEX[code]]
+            x, y = t % self.width, t // self.width
+            if old == RECYCLING_BIN_TILE or code == RECYCLING_BIN_TILE:
+                self._clusters.touch(t)
+                if code == RECYCLING_BIN_TILE:
+                    self._row_runs[y].add(x)
+                    self._col_runs[x].add(y)
+                else:
+                    self._row_runs[y].remove(x)
+                    self._col_runs[x].remove(y)
+            if old == EMPTY_TILE or code == EMPTY_TILE:
+                row, col = self._row_stops[y], self._col_stops[x]
+                if code != EMPTY_TILE:
+                    row.insert(bisect_left(row, x), x)
+                    col.insert(bisect_left(col, y), y)
+                else:
+                    del row[bisect_left(row, x)]
+                    del col[bisect_left(col, y)]
+
+    def fill(self, codes: bytes) -> None:
+        """Set every tile code at once to the given <codes>, which is much
+        faster than setting them one at a time with set_code.
+
+        Precondition: every tile is empty, and len(codes) == len(self.codes)
+        """
+        self.codes[:] = codes
+        self._text = None
+        for t in self.nonempty():
+            code = codes[t]
+            x, y = t % self.width, t // self.width
+            self._row_stops[y].append(x)
+            self._col_stops[x].append(y)
+            self.hash ^= _ZOBRIST_KEYS[t * _NUM_TILE_CODES
+                                       + _ZOBRIST_INDEX[code]]
+            if code == RECYCLING_BIN_TILE:
+                self._clusters.touch(t)
+                self._row_runs[y].add(x)
+                self._col_runs[x].add(y)
+
+    def nonempty(self) -> List[int]:
+        """Return the indexes of the tiles that are not empty, in increasing
+        order.
+
+        >>> tiles = TileIndex(3, 1)
+        >>> tiles.fill(b'P-B')
+        >>> tiles.nonempty()
+        [0, 2]
+        """
+        return changed_indices(self.codes,
+                               bytes([EMPTY_TILE]) * len(self.codes))
+
+    def changed_tiles(self) -> Set[Tuple[int, int]]:
+        """Return the set of tiles (x, y) whose tile code has changed since
+        the last time this method was called.
+        """
+        w = self.width
+        changed = {(t % w, t // w) for t, code in self._dirty.items()
+                   if self.codes[t] != code}
+        self._dirty = {}
+        return changed
+
+    def inherit_changes(self, old: TileIndex) -> None:
+        """Make changed_tiles report the tiles whose tile code has changed
+        since changed_tiles was last called on <old>, the index this index
+        replaces as the index of a board. Every tile counts as changed if
+        <old> is for a board of a different size.
+
+        >>> old = TileIndex(3, 1)
+        >>> old.set_code(0, PLAYER_TILE)
+        >>> new = TileIndex(3, 1)
+        >>> new.set_code(2, RECYCLING_BIN_TILE)
+        >>> new.inherit_changes(old)
+        >>> new.changed_tiles()
+        {(2, 0)}
+        >>> new = TileIndex(2, 1)
+        >>> new.inherit_changes(old)
+        >>> sorted(new.changed_tiles())
+        [(0, 0), (1, 0)]
+        """
+        if (self.width, self.height) != (old.width, old.height):
+            self._dirty = dict.fromkeys(range(len(self.codes)), 0)
+            return
+        self._dirty = old._dirty.copy()
+        for t in changed_indices(old.codes, self.codes):
+            self._dirty.setdefault(t, old.codes[t])
+
+    def text(self) -> str:
+        """Return the string representation of the board, one line of
+        characters per row.
+        """
+        if self._text is None:
+            w = self.width
+            self._text = '\n'.join(self.codes[i * w:(i + 1) * w].decode()
+                                   for i in range(self.height))
+        return self._text
+
+    def largest_cluster(self) -> int:
+        """Return the number of tiles in the largest cluster of adjacent
+        tiles that show a recycling bin, or 0 if there are none.
+        """
+        return self._clusters.largest(self.codes)
+
+    def bin_run(self, x: int, y: int, direction: Tuple[int, int]) -> int:
+        """Return how many recycling bins there are in a row starting at tile
+        (x, y) and going in <direction>.
+
+        >>> tiles = TileIndex(5, 1)
+        >>> for t in (1, 2, 3):
+        ...     tiles.set_code(t, RECYCLING_BIN_TILE)
+        >>> tiles.bin_run(1, 0, (1, 0)), tiles.bin_run(2, 0, (-1, 0))
+        (3, 2)
+        >>> tiles.bin_run(0, 0, (1, 0))
+        0
+        """
+        if self.code(x, y) != RECYCLING_BIN_TILE:
+            return 0
+        if direction[1] == 0:
+            start, end = self._row_runs[y].extent(x)
+            pos, step = x, direction[0]
+        else:
+            start, end = self._col_runs[x].extent(y)
+            pos, step = y, direction[1]
+        if step > 0:
+            return end - pos + 1
+        return pos - start + 1
+
+    def sight_distance(self, x: int, y: int, direction: Tuple[int, int],
+                       player: Optional[Tuple[int, int]]) -> Optional[int]:
+        """Return how many tiles away the closest GarbageCan in the line of
+        sight from tile (x, y) in <direction> is, as described in
+        SmartRaccoon.take_turn, or None if there is no such GarbageCan.
+        <player> is the tile of the Player, which does not block the line of
+        sight, or None if there is no Player.
+
+        This looks up the closest tile in that direction that blocks the line
+        of sight in _row_stops or _col_stops, rather than walking the tiles.
+
+        >>> tiles = TileIndex(6, 1)
+        >>> for t, char in enumerate('O-S-PO'):
+        ...     tiles.set_code(t, ord(char))
+        >>> tiles.sight_distance(2, 0, (-1, 0), (4, 0))
+        2
+        >>> tiles.sight_distance(2, 0, (1, 0), (4, 0))
+        3
+        >>> tiles.sight_distance(5, 0, (-1, 0), (4, 0)) is None
+        True
+        """
+        if self.index(x, y) is None:
+            return None
+        if direction[1] == 0:
+            line, pos, step = self._row_stops[y], x, direction[0]
+        else:
+            line, pos, step = self._col_stops[x], y, direction[1]
+        player_pos = None
+        if player is not None:
+            if direction[1] == 0 and player[1] == y:
+                player_pos = player[0]
+            elif direction[1] != 0 and player[0] == x:
+                player_pos = player[1]
+        if step < 0:
+            k = bisect_left(line, pos) - 1
+            if k >= 0 and line[k] == player_pos:
+                k -= 1
+            if k < 0:
+                return None
+        else:
+            k = bisect_right(line, pos)
+            if k < len(line) and line[k] == player_pos:
+                k += 1
+            if k >= len(line):
+                return None
+        stop = line[k]
+        if direction[1] == 0:
+            code = self.codes[y * self.width + stop]
+        else:
+            code = self.codes[stop * self.width + x]
+        if code != OPEN_CAN_TILE:
+            return None
+        return abs(stop - pos)
+
+    def open_masks(self) -> List[bytes]:
+        """Return, for each direction in _BESIDE, one byte per tile (in the
+        same order as codes) that is 1 if the tile one step in that direction
+        is on the board and does not block a Raccoon, and 0 otherwise.
+
+        Every tile is worked out at once, by treating the tile codes as one
+        big integer with a byte for each tile and shifting it by a tile or a
+        row in each direction.
+
+        >>> tiles = TileIndex(3, 1)
+        >>> tiles.set_code(0, RACCOON_TILE)
+        >>> tiles.set_code(2, RECYCLING_BIN_TILE)
+        >>> [list(mask) for mask in tiles.open_masks()]
+        [[0, 0, 1], [0, 0, 0], [1, 0, 0], [0, 0, 0]]
+        """
+        w, h = self.width, self.height
+        n = w * h
+        all_tiles = (1 << (8 * n)) - 1
+        open_tiles = int.from_bytes(self.codes.translate(_OPEN_TABLE),
+                                    'little')
+        # the tiles that have a tile to their left, and to their right
+        has_left = int.from_bytes((b'\x00' + b'\x01' * (w - 1)) * h, 'little')
+        has_right = int.from_bytes((b'\x01' * (w - 1) + b'\x00') * h, 'little')
+        shifted = [(open_tiles << 8) & has_left,
+                   (open_tiles << (8 * w)) & all_tiles,
+                   (open_tiles >> 8) & has_right,
+                   open_tiles >> (8 * w)]
+        return [mask.to_bytes(n, 'little') for mask in shifted]
+
+
+class EntityStore:
+    """The state of every character on a board, where each character is
+    identified by its entity id: the order in which it was placed on the
+    board. Character objects are thin views over this, made as needed.
+
+    === Public Attributes ===
+    kinds:
+        the tile code each entity would have if it were alone on a tile.
+        For a GarbageCan, this also records whether it is locked.
+    xs, ys:
+        the coordinates of each entity
+    inside:
+        for each Raccoon entity, whether it is inside a garbage can
+    trapped:
+        for each Raccoon entity, whether it is counted in num_trapped
+    raccoons:
+        the entity ids of the raccoons
+    recycling_bins:
+        the entity ids of the recycling bins
+    garbage_cans:
+        the entity ids of the garbage cans
+    num_trapped:
+        the number of raccoons that are trapped and not inside a garbage can
+    num_inside:
+        the number of raccoons inside a garbage can
+    unsettled:
+        the tiles whose characters have changed since num_trapped was last
+        brought up to date. Only raccoons on or beside these tiles can have
+        become trapped or untrapped since then.
+    occupants:
+        for every tile on the board, in the same order as the tile codes,
+        the id of the only entity on it, NO_ENTITY if the tile is empty, or
+        STACKED if the tile holds more than one entity
+    stacks:
+        the entity ids on each tile that holds more than one entity or is
+        not on the board, keyed by (x, y) and kept in the order that
+        GameBoard.at returns them in
+
+    === Sample Usage ===
+    >>> tiles = TileIndex(2, 1)
+    >>> store = EntityStore(2)
+    >>> store.place(store.new(OPEN_CAN_TILE, 1, 0), tiles)
+    >>> store.place(store.new(RACCOON_TILE, 1, 0), tiles)
+    >>> store.ids_at(1, 0, tiles), tiles.text()
+    ([1, 0], '-@')
+    >>> store.move(1, 0, 0, tiles)
+    >>> store.ids_at(1, 0, tiles), tiles.text()
+    ([0], 'RO')
+    """
+    kinds: bytearray
+    xs: array
+    ys: array
+    inside: bytearray
+    trapped: bytearray
+    raccoons: array
+    recycling_bins: array
+    garbage_cans: array
+    num_trapped: int
+    num_inside: int
+    unsettled: Set[Tuple[int, int]]
+    occupants: array
+    stacks: Dict[Tuple[int, int], List[int]]
+
+    def __init__(self, n: int) -> None:
+        """Initialize a store with no entities, for a board of <n> tiles.
+        """
+        self.kinds = bytearray()
+        self.xs = array('i')
+        self.ys = array('i')
+        self.inside = bytearray()
+        self.trapped = bytearray()
+        self.raccoons = array('i')
+        self.recycling_bins = array('i')
+        self.garbage_cans = array('i')
+        self.num_trapped = 0
+        self.num_inside = 0
+        self.unsettled = set()
+        self.occupants = array('i', [NO_ENTITY]) * n
+        self.stacks = {}
+
+    def copy(self) -> EntityStore:
+        """Return an independent copy of this store.
+        """
+        other = EntityStore(0)
+        other.kinds = self.kinds[:]
+        other.xs = self.xs[:]
+        other.ys = self.ys[:]
+        other.inside = self.inside[:]
+        other.trapped = self.trapped[:]
+        other.raccoons = self.raccoons[:]
+        other.recycling_bins = self.recycling_bins[:]
+        other.garbage_cans = self.garbage_cans[:]
+        other.num_trapped = self.num_trapped
+        other.num_inside = self.num_inside
+        other.unsettled = self.unsettled.copy()
+        other.occupants = self.occupants[:]
+        other.stacks = {tile: ids[:] for tile, ids in self.stacks.items()}
+        return other
+
+    def new(self, kind: int, x: int, y: int) -> int:
+        """Add an entity of the given <kind> at tile (x, y) and return its
+        id. The entity is not on its tile until it is placed.
+        """
+        self.kinds.append(kind)
+        self.xs.append(x)
+        self.ys.append(y)
+        self.inside.append(False)
+        self.trapped.append(False)
+        return len(self.kinds) - 1
+
+    def _stack_order(self, i: int) -> Tuple[int, int]:
+        """Return where entity <i> sorts among the entities on its tile: the
+        player first, then raccoons, recycling bins and garbage cans, each in
+        the order they were placed on the board.
+        """
+        return _STACK_RANKS[self.kinds[i]], i
+
+    def place(self, i: int, tiles: TileIndex) -> None:
+        """Put entity <i> on its tile, and add it to the raccoons, recycling
+        bins or garbage cans, as its kind says.
+        """
+        kind = self.kinds[i]
+        if kind in (RACCOON_TILE, SMART_RACCOON_TILE):
+            self.raccoons.append(i)
+        elif kind == RECYCLING_BIN_TILE:
+            self.recycling_bins.append(i)
+        elif kind in (OPEN_CAN_TILE, CLOSED_CAN_TILE):
+            self.garbage_cans.append(i)
+        self.link(i, tiles)
+
+    def move(self, i: int, x: int, y: int, tiles: TileIndex) -> None:
+        """Move entity <i> from its tile to tile (x, y).
+        """
+        self.unlink(i, tiles)
+        self.xs[i], self.ys[i] = x, y
+        self.link(i, tiles)
+
+    def set_kind(self, i: int, kind: int, tiles: TileIndex) -> None:
+        """Change the kind of entity <i> to <kind>, updating the tile code of
+        its tile in <tiles> if it is alone there.
+        """
+        self.kinds[i] = kind
+        t = tiles.index(self.xs[i], self.ys[i])
+        if t is not None and self.occupants[t] == i:
+            tiles.set_code(t, kind)
+
+    def set_inside(self, i: int, inside: bool) -> None:
+        """Record whether the Raccoon entity <i> is inside a garbage can.
+        """
+        if bool(self.inside[i]) != inside:
+            self.inside[i] = inside
+            self.num_inside += 1 if inside else -1
+            self.unsettled.add((self.xs[i], self.ys[i]))
+
+    def link(self, i: int, tiles: TileIndex) -> None:
+        """Record that entity <i> is on its tile, updating the tile code of
+        that tile in <tiles>.
+        """
+        x, y = self.xs[i], self.ys[i]
+        self.unsettled.add((x, y))
+        t = tiles.index(x, y)
+        if t is not None:
+            occupant = self.occupants[t]
+            if occupant == NO_ENTITY:
+                self.occupants[t] = i
+                tiles.set_code(t, self.kinds[i])
+                return
+            if occupant != STACKED:
+                self.occupants[t] = STACKED
+                self.stacks[(x, y)] = [occupant]
+                tiles.set_code(t, RACCOON_IN_CAN_TILE)
+        stack = self.stacks.setdefault((x, y), [])
+        key = self._stack_order(i)
+        j = 0
+        while j < len(stack) and self._stack_order(stack[j]) < key:
+            j += 1
+        stack.insert(j, i)
+
+    def unlink(self, i: int, tiles: TileIndex) -> None:
+        """Record that entity <i> is no longer on its tile, updating the tile
+        code of that tile in <tiles>.
+        """
+        x, y = self.xs[i], self.ys[i]
+        self.unsettled.add((x, y))
+        t = tiles.index(x, y)
+        if t is not None:
+            if self.occupants[t] == i:
+                self.occupants[t] = NO_ENTITY
+                tiles.set_code(t, EMPTY_TILE)
+                return
+            stack = self.stacks[(x, y)]
+            stack.remove(i)
+            if len(stack) == 1:
+                del self.stacks[(x, y)]
+                self.occupants[t] = stack[0]
+                tiles.set_code(t, self.kinds[stack[0]])
+        else:
+            stack = self.stacks[(x, y)]
+            stack.remove(i)
+            if len(stack) == 0:
+                del self.stacks[(x, y)]
+
+    def shift(self, i: int, k: int, direction: Tuple[int, int],
+              tiles: TileIndex) -> bool:
+        """Move entity <i> and the <k> entities in a row in front of it one
+        tile in <direction> all at once, and return True, if entity <i> is
+        alone on its tile. Otherwise, move nothing and return False.
+
+        This shifts the whole row of occupants at once, and only the tile
+        entity <i> leaves and the tile the last entity moves onto change
+        their tile codes in <tiles>.
+
+        Preconditions:
+        - entity <i> is a recycling bin, the <k> tiles in front of it in
+          <direction> each hold a single recycling bin, and the tile after
+          them is empty and on the board
+
+        >>> tiles = TileIndex(4, 1)
+        >>> store = EntityStore(4)
+        >>> for x in (0, 1):
+        ...     store.place(store.new(RECYCLING_BIN_TILE, x, 0), tiles)
+        >>> store.shift(0, 1, (1, 0), tiles), tiles.text()
+        (True, '-BB-')
+        >>> list(store.xs), store.ids_at(2, 0, tiles)
+        ([1, 2], [1])
+        """
+        dx, dy = direction
+        x, y = self.xs[i], self.ys[i]
+        start = tiles.index(x, y)
+        if start is None or self.occupants[start] != i:
+            return False
+        step = dx + dy * tiles.width
+        end = start + (k + 1) * step
+        if step > 0:
+            self.occupants[start + step:end + step:step] = \
+                self.occupants[start:end:step]
+        else:
+            self.occupants[end:start:-step] = \
+                self.occupants[end - step:start - step:-step]
+        self.occupants[start] = NO_ENTITY
+        for t in range(start + step, end + step, step):
+            moved = self.occupants[t]
+            self.xs[moved] += dx
+            self.ys[moved] += dy
+        tiles.set_code(start, EMPTY_TILE)
+        tiles.set_code(end, self.kinds[self.occupants[end]])
+        self.unsettled.add((x, y))
+        self.unsettled.add((x + (k + 1) * dx, y + (k + 1) * dy))
+        return True
+
+    def ids_at(self, x: int, y: int, tiles: TileIndex) -> List[int]:
+        """Return the ids of the entities at tile (x, y) of the board whose
+        tile index is <tiles>, in the order that GameBoard.at returns them in.
+        """
+        t = tiles.index(x, y)
+        if t is not None:
+            occupant = self.occupants[t]
+            if occupant == NO_ENTITY:
+                return []
+            if occupant != STACKED:
+                return [occupant]
+        return list(self.stacks.get((x, y), []))
+
+    def fill(self, tiles: TileIndex) -> Optional[int]:
+        """Add an entity for every character shown by the tile codes in
+        <tiles>, with the same ids and order on each tile that placing them
+        one at a time in row-major order would give, and return the id of
+        the Player, or None if there is none.
+
+        As with GameBoard.setup_from_grid, a tile showing a raccoon inside a
+        garbage can gets a Raccoon, placed after the GarbageCan.
+
+        Precondition: this store has no entities, and tiles is for the same
+        board
+        """
+        player = None
+        for t in tiles.nonempty():
+            code = tiles.codes[t]
+            x, y = t % tiles.width, t // tiles.width
+            i = len(self.kinds)
+            if code == RACCOON_IN_CAN_TILE:
+                # the raccoon comes first on the tile
+                self.kinds.extend((OPEN_CAN_TILE, RACCOON_TILE))
+                self.xs.extend((x, x))
+                self.ys.extend((y, y))
+                self.garbage_cans.append(i)
+                self.raccoons.append(i + 1)
+                self.occupants[t] = STACKED
+                self.stacks[(x, y)] = [i + 1, i]
+                self.unsettled.add((x, y))
+                continue
+            self.kinds.append(code)
+            self.xs.append(x)
+            self.ys.append(y)
+            self.occupants[t] = i
+            if code == PLAYER_TILE:
+                player = i
+            elif code == RECYCLING_BIN_TILE:
+                self.recycling_bins.append(i)
+            elif code in (OPEN_CAN_TILE, CLOSED_CAN_TILE):
+                self.garbage_cans.append(i)
+            else:
+                self.raccoons.append(i)
+                self.unsettled.add((x, y))
+        self.inside = bytearray(len(self.kinds))
+        self.trapped = bytearray(len(self.kinds))
+        return player
+
+    def settle(self, tiles: TileIndex) -> List[int]:
+        """Bring num_trapped and num_inside up to date by checking the
+        raccoons on or beside the unsettled tiles, the same way
+        Raccoon.check_trapped does, where <tiles> is the tile index of the
+        board. Return the ids of the raccoons this finds inside a garbage
+        can that were not known to be.
+
+        >>> tiles = TileIndex(3, 1)
+        >>> store = EntityStore(3)
+        >>> for kind, x in [(RACCOON_TILE, 0), (OPEN_CAN_TILE, 1),
+        ...                 (RACCOON_TILE, 1), (RECYCLING_BIN_TILE, 2)]:
+        ...     store.place(store.new(kind, x, 0), tiles)
+        >>> store.settle(tiles), store.num_trapped, store.num_inside
+        ([2], 1, 1)
+        """
+        found = []
+        while self.unsettled:
+            changed = self.unsettled
+            self.unsettled = set()
+            checked = set()
+            for x, y in changed:
+                for dx, dy in _SELF_AND_BESIDE:
+                    code = tiles.code(x + dx, y + dy)
+                    if code is None or code in _RACCOON_TILES:
+                        for i in self.ids_at(x + dx, y + dy, tiles):
+                            if i not in checked and self.kinds[i] in \
+                                    (RACCOON_TILE, SMART_RACCOON_TILE):
+                                checked.add(i)
+                                if self._settle(i, tiles):
+                                    found.append(i)
+        return found
+
+    def _settle(self, i: int, tiles: TileIndex) -> bool:
+        """Check whether the Raccoon entity <i> is trapped or inside a
+        garbage can, update num_trapped and num_inside to match, and return
+        whether it was found inside a garbage can that it was not known to
+        be inside.
+        """
+        x, y = self.xs[i], self.ys[i]
+        found = tiles.code(x, y) == RACCOON_IN_CAN_TILE and not self.inside[i]
+        if found:
+            self.set_inside(i, True)
+        counted = not self.inside[i]
+        for dx, dy in _BESIDE:
+            if tiles.code(x + dx, y + dy) in OPEN_TO_RACCOONS:
+                counted = False
+        if counted != self.trapped[i]:
+            self.trapped[i] = counted
+            self.num_trapped += 1 if counted else -1
+        return found
+
+    def raccoon_moves(self, tiles: TileIndex) \
+            -> List[Tuple[int, bool, List[Tuple[int, int]]]]:
+        """Return, for every raccoon in the order they were placed, a tuple
+        of its id, whether it is trapped, and the directions it could move in
+        on its turn, as described in GameBoard.raccoon_moves, where <tiles>
+        is the tile index of the board.
+
+        >>> tiles = TileIndex(3, 1)
+        >>> store = EntityStore(3)
+        >>> for kind, x in [(RACCOON_TILE, 0), (RECYCLING_BIN_TILE, 2)]:
+        ...     store.place(store.new(kind, x, 0), tiles)
+        >>> store.raccoon_moves(tiles)
+        [(0, False, [(1, 0)])]
+        """
+        masks = tiles.open_masks()
+        lst = []
+        for i in self.raccoons:
+            x, y = self.xs[i], self.ys[i]
+            t = tiles.index(x, y)
+            if t is not None:
+                moves = [d for d, mask in zip(_BESIDE, masks) if mask[t]]
+                inside = self.inside[i] or \
+                    tiles.codes[t] == RACCOON_IN_CAN_TILE
+            else:
+                moves = [(dx, dy) for dx, dy in _BESIDE
+                         if tiles.code(x + dx, y + dy) in OPEN_TO_RACCOONS]
+                inside = self.inside[i]
+            trapped = len(moves) == 0
+            if inside:
+                moves = []
+            lst.append((i, trapped, moves))
+        return lst
+
+
+class Journal:
+    """A record of the changes made to a board, turn by turn, so that whole
+    turns can be taken back and made again.
+
+    Each change is a tuple of its kind and what is needed to make and unmake
+    it: ('move', i, old_x, old_y, x, y, was_inside), ('push', i, k,
+    direction), ('kind', i, old_kind, kind), ('inside', i, old_inside,
+    inside) and ('attr', name, old_value, value). The board makes and
+    unmakes them, with the function it passes to undo and redo.
+
+    === Public Attributes ===
+    changes:
+        every change recorded, in order, with None after the changes of
+        each turn
+    undone:
+        the changes of each turn taken back since the last new change, most
+        recently taken back last
+
+    === Private Attributes ===
+    _replaying:
+        whether changes are being taken back or made again, in which case
+        the changes made to the board are not recorded
+
+    === Sample Usage ===
+    >>> journal = Journal()
+    >>> journal.record(('attr', 'turns', 0, 1))
+    >>> journal.end_turn()
+    >>> journal.undo(lambda change, backwards: print(change, backwards))
+    ('attr', 'turns', 0, 1) True
+    True
+    >>> journal.undo(print)
+    False
+    >>> journal.redo(lambda change, backwards: print(change, backwards))
+    ('attr', 'turns', 0, 1) False
+    True
+    """
+    changes: List[Optional[tuple]]
+    undone: List[List[tuple]]
+    _replaying: bool
+
+    def __init__(self) -> None:
+        """Initialize an empty journal.
+        """
+        self.changes = []
+        self.undone = []
+        self._replaying = False
+
+    def copy(self) -> Journal:
+        """Return an independent copy of this journal.
+        """
+        other = Journal()
+        other.changes = self.changes[:]
+        other.undone = [changes[:] for changes in self.undone]
+        return other
+
+    def record(self, change: tuple) -> None:
+        """Record that <change> was made, which forgets the turns taken back,
+        unless it was made while taking back or making again a turn.
+        """
+        if not self._replaying:
+            self.changes.append(change)
+            if self.undone:
+                self.undone = []
+
+    def end_turn(self) -> None:
+        """Record that a turn has ended.
+        """
+        self.changes.append(None)
+
+    def undo(self, apply: Callable[[tuple, bool], None]) -> bool:
+        """Take back the changes of the last turn recorded, or those made
+        since it if there are any, by calling apply(change, True) on each of
+        them, latest first, and return whether there were any changes
+        recorded.
+        """
+        if not self.changes:
+            return False
+        if self.changes[-1] is None:
+            self.changes.pop()
+        changes = []
+        while self.changes and self.changes[-1] is not None:
+            changes.append(self.changes.pop())
+        self._replay(changes, apply, True)
+        changes.reverse()
+        self.undone.append(changes)
+        return True
+
+    def redo(self, apply: Callable[[tuple, bool], None]) -> bool:
+        """Make again the changes of the last turn taken back, by calling
+        apply(change, False) on each of them in the order they were first
+        made, and return whether any turn had been taken back since the last
+        new change.
+        """
+        if not self.undone:
+            return False
+        changes = self.undone.pop()
+        self._replay(changes, apply, False)
+        self.changes.extend(changes)
+        self.end_turn()
+        return True
+
+    def _replay(self, changes: List[tuple],
+                apply: Callable[[tuple, bool], None], backwards: bool) -> None:
+        """Call apply(change, backwards) on each of <changes> in order,
+        without recording the changes it makes.
+        """
+        self._replaying = True
+        for change in changes:
+            apply(change, backwards)
+        self._replaying = False
+
+
+class BinClusters:
+    """An index of the clusters of adjacent recycling bins on a board, which
+    TileIndex keeps so that GameBoard.adjacent_bin_score does not have to
+    search the whole board.
+
+    Tiles are given by their index in the tile codes of the board. The
+    TileIndex reports every tile whose tile code changes to or from 'B' with
+    touch, and the index catches up with those changes the next time it is
+    asked for the largest cluster, so a tile that stops being a recycling
+    bin and becomes one again in between costs nothing.
+
+    === Private Attributes ===
+    _width:
+        the width of the board
+    _labels:
+        for every tile, the label of the cluster it is in, or -1 if the tile
+        is not a recycling bin as far as this index knows
+    _sizes:
+        the number of tiles in each cluster, by label
+    _size_counts:
+        the number of clusters of each size
+    _largest:
+        the size of the largest cluster, or 0 if there are none
+    _next_label:
+        the label to give the next new cluster
+    _pending:
+        the tiles touched since the index last caught up
+
+    === Sample Usage ===
+    >>> codes = bytearray(b'BB-B')
+    >>> clusters = BinClusters(2, 2)
+    >>> for t in (0, 1, 3):
+    ...     clusters.touch(t)
+    >>> clusters.largest(codes)
+    3
+    >>> codes[1] = EMPTY_TILE
+    >>> clusters.touch(1)
+    >>> clusters.largest(codes)
+    1
+    """
+    _width: int
+    _labels: array
+    _sizes: Dict[int, int]
+    _size_counts: Dict[int, int]
+    _largest: int
+    _next_label: int
+    _pending: Set[int]
+
+    def __init__(self, w: int, h: int) -> None:
+        """Initialize an index of a <w> by <h> board with no recycling bins.
+        """
+        self._width = w
+        self._labels = array('i', [-1]) * (w * h)
+        self._sizes = {}
+        self._size_counts = {}
+        self._largest = 0
+        self._next_label = 0
+        self._pending = set()
+
+    def touch(self, t: int) -> None:
+        """Record that tile <t> may have become or stopped being a recycling
+        bin.
+        """
+        self._pending.add(t)
+
+    def copy(self) -> BinClusters:
+        """Return an independent copy of this index.
+        """
+        other = BinClusters(0, 0)
+        other._width = self._width
+        other._labels = self._labels[:]
+        other._sizes = self._sizes.copy()
+        other._size_counts = self._size_counts.copy()
+        other._largest = self._largest
+        other._next_label = self._next_label
+        other._pending = self._pending.copy()
+        return other
+
+    def largest(self, codes: bytearray) -> int:
+        """Return the size of the largest cluster of adjacent recycling bins,
+        where <codes> are the current tile codes of the board.
+        """
+        if self._pending:
+            for t in self._pending:
+                if self._labels[t] >= 0 and codes[t] != RECYCLING_BIN_TILE:
+                    self._remove(t)
+            for t in self._pending:
+                if self._labels[t] < 0 and codes[t] == RECYCLING_BIN_TILE:
+                    self._add(t)
+            self._pending = set()
+        return self._largest
+
+    def _neighbours(self, t: int) -> List[int]:
+        """Return the tiles adjacent to tile <t> that are in a cluster.
+        """
+        w = self._width
+        lst = []
+        if t % w > 0 and self._labels[t - 1] >= 0:
+            lst.append(t - 1)
+        if t >= w and self._labels[t - w] >= 0:
+            lst.append(t - w)
+        if t % w < w - 1 and self._labels[t + 1] >= 0:
+            lst.append(t + 1)
+        if t + w < len(self._labels) and self._labels[t + w] >= 0:
+            lst.append(t + w)
+        return lst
+
+    def _joined_around(self, t: int) -> bool:
+        """Return whether the clustered tiles adjacent to tile <t> are
+        connected to each other through the eight tiles around <t>, in which
+        case removing <t> cannot split its cluster.
+        """
+        w = self._width
+        h = len(self._labels) // w
+        x, y = t % w, t // w
+        ring = []
+        for dx, dy in _RING:
+            nx, ny = x + dx, y + dy
+            ring.append(0 <= nx < w and 0 <= ny < h
+                        and self._labels[ny * w + nx] >= 0)
+        if all(ring):
+            return True
+        # walk once around the ring from an empty tile, counting the runs of
+        # clustered tiles that contain a tile adjacent to <t>
+        start = ring.index(False)
+        runs = 0
+        counted = False
+        for k in range(1, len(ring) + 1):
+            i = (start + k) % len(ring)
+            if not ring[i]:
+                counted = False
+            elif i % 2 == 0 and not counted:
+                runs += 1
+                counted = True
+        return runs <= 1
+
+    def _relabel(self, start: int, label: int) -> int:
+        """Give every tile in the cluster containing tile <start> the label
+        <label>, and return how many tiles that is.
+
+        Precondition: the cluster containing <start> is not labelled <label>.
+        """
+        old = self._labels[start]
+        self._labels[start] = label
+        todo = [start]
+        count = 0
+        while todo:
+            t = todo.pop()
+            count += 1
+            for n in self._neighbours(t):
+                if self._labels[n] == old:
+                    self._labels[n] = label
+                    todo.append(n)
+        return count
+
+    def _resize(self, label: int, size: int) -> None:
+        """Set the size of the cluster <label> to <size>, where a size of 0
+        removes it.
+        """
+        old = self._sizes.pop(label, 0)
+        if old:
+            self._size_counts[old] -= 1
+            if self._size_counts[old] == 0:
+                del self._size_counts[old]
+        if size:
+            self._sizes[label] = size
+            self._size_counts[size] = self._size_counts.get(size, 0) + 1
+        if size > self._largest:
+            self._largest = size
+        elif old == self._largest and old not in self._size_counts:
+            self._largest = max(self._size_counts, default=0)
+
+    def _new_label(self) -> int:
+        """Return a label that no cluster has yet.
+        """
+        self._next_label += 1
+        return self._next_label - 1
+
+    def _add(self, t: int) -> None:
+        """Add tile <t> to the clusters, merging the clusters around it.
+        """
+        labels = {self._labels[n] for n in self._neighbours(t)}
+        if not labels:
+            label = self._new_label()
+            self._labels[t] = label
+            self._resize(label, 1)
+            return
+        # keep the label of the biggest cluster and relabel the others
+        label = max(labels, key=self._sizes.get)
+        size = self._sizes[label] + 1
+        self._labels[t] = label
+        for n in self._neighbours(t):
+            other = self._labels[n]
+            if other != label:
+                self._resize(other, 0)
+                size += self._relabel(n, label)
+        self._resize(label, size)
+
+    def _remove(self, t: int) -> None:
+        """Remove tile <t> from the clusters, splitting the cluster it was in
+        if that disconnects it.
+        """
+        label = self._labels[t]
+        size = self._sizes[label] - 1
+        self._labels[t] = -1
+        neighbours = self._neighbours(t)
+        if len(neighbours) < 2 or self._joined_around(t):
+            self._resize(label, size)
+            return
+        self._resize(label, 0)
+        for n in neighbours:
+            if self._labels[n] == label:
+                new_label = self._new_label()
+                self._resize(new_label, self._relabel(n, new_label))
+
+
+class BinRuns:
+    """The runs of recycling bins along one row or column of a board, where a
+    run is a longest stretch of consecutive tiles that are all recycling bins.
+    TileIndex keeps one of these for every row and column, so that the end
+    of a row of bins being pushed can be found without walking along it.
+
+    Positions are x coordinates for a row and y coordinates for a column.
+
+    === Private Attributes ===
+    _starts:
+        the first position of each run, in increasing order
+    _ends:
+        the last position of each run, in the same order as _starts
+
+    === Sample Usage ===
+    >>> runs = BinRuns()
+    >>> for pos in (1, 2, 4, 3):
+    ...     runs.add(pos)
+    >>> runs.extent(2)
+    (1, 4)
+    >>> runs.remove(3)
+    >>> runs.extent(2), runs.extent(4)
+    ((1, 2), (4, 4))
+    """
+    _starts: List[int]
+    _ends: List[int]
+
+    def __init__(self) -> None:
+        """Initialize a row or column with no recycling bins.
+        """
+        self._starts = []
+        self._ends = []
+
+    def copy(self) -> BinRuns:
+        """Return an independent copy of these runs.
+        """
+        other = BinRuns()
+        other._starts = self._starts[:]
+        other._ends = self._ends[:]
+        return other
+
+    def add(self, pos: int) -> None:
+        """Record that there is now a recycling bin at <pos>.
+
+        Precondition: there was not a recycling bin at <pos>.
+        """
+        k = bisect_right(self._starts, pos)
+        joins_left = k > 0 and self._ends[k - 1] == pos - 1
+        joins_right = k < len(self._starts) and self._starts[k] == pos + 1
+        if joins_left and joins_right:
+            self._ends[k - 1] = self._ends[k]
+            del self._starts[k]
+            del self._ends[k]
+        elif joins_left:
+            self._ends[k - 1] = pos
+        elif joins_right:
+            self._starts[k] = pos
+        else:
+            self._starts.insert(k, pos)
+            self._ends.insert(k, pos)
+
+    def remove(self, pos: int) -> None:
+        """Record that there is no longer a recycling bin at <pos>.
+
+        Precondition: there was a recycling bin at <pos>.
+        """
+        k = bisect_right(self._starts, pos) - 1
+        start, end = self._starts[k], self._ends[k]
+        if start == end:
+            del self._starts[k]
+            del self._ends[k]
+        elif pos == start:
+            self._starts[k] = pos + 1
+        elif pos == end:
+            self._ends[k] = pos - 1
+        else:
+            self._ends[k] = pos - 1
+            self._starts.insert(k + 1, pos + 1)
+            self._ends.insert(k + 1, end)
+
+    def extent(self, pos: int) -> Tuple[int, int]:
+        """Return the first and last positions of the run containing <pos>.
+
+        Precondition: there is a recycling bin at <pos>.
+        """
+        k = bisect_right(self._starts, pos) - 1
+        return self._starts[k], self._ends[k]
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
+
+    import python_ta
+    python_ta.check_all(config={
+        'allowed-io': [],
+        'allowed-import-modules': ['doctest', 'python_ta', 'typing',
+                                   'random', '__future__', 'array',
+                                   'bisect'],
+        'disable': ['E1136'],
+        'max-attributes': 15,
+        'max-module-lines': 1600
+    })
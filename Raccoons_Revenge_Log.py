@@ -0,0 +1,332 @@
+"""Raccoon Raiders board logging
+
+=== Module Description ===
+This module contains a logger that writes the states of a board somewhere,
+such as the console or a file, on a background thread, so that the game loop
+never waits for the output to be written.
+
+The game loop hands the logger a copy of the tile codes of the board, which
+is cheap to take, and everything else, from rebuilding the text of the board
+to writing it out, is done by a sink on the background thread. The states
+waiting to be written are kept in a bounded queue, and when the sink falls
+behind, the logger either drops new states or coalesces them with the newest
+state waiting, as its policy says.
+"""
+
+from __future__ import annotations
+
+import sys
+import threading
+from collections import deque
+from typing import Deque, Optional, TextIO, Tuple
+
+import Raccoons_Revenge
+from Raccoons_Revenge_Index import changed_indices
+
+# Policies for a state logged while the queue is full: DROP leaves it out,
+# and COALESCE puts it in place of the newest state in the queue, so that
+# the last state logged is always written.
+DROP = 'drop'
+COALESCE = 'coalesce'
+
+# Default number of states waiting to be written
+QUEUE_SIZE = 4
+
+
+def _rows(width: int, codes: bytes) -> str:
+    """Return the string representation of the board with the tile codes
+    <codes> and width <width>, in the format of GameBoard.__str__.
+
+    >>> _rows(3, b'P-BR-@')
+    'P-B\\nR-@'
+    """
+    return '\n'.join(codes[y:y + width].decode()
+                     for y in range(0, len(codes), width))
+
+
+class BoardSink:
+    """A destination for the states of a board, which are written to it one
+    at a time, on the background thread of a BoardLogger.
+
+    This class is abstract and should not be directly instantiated.
+    """
+
+    def write(self, turn: int, width: int, codes: bytes) -> None:
+        """Write the state of a board of width <width> after <turn> turns,
+        whose tile codes are <codes>, in the format of GameBoard.tile_codes.
+        """
+        raise NotImplementedError
+
+    def close(self) -> None:
+        """Finish writing the states written to this sink.
+        """
+
+
+class NullSink(BoardSink):
+    """A sink that writes nothing.
+    """
+
+    def write(self, turn: int, width: int, codes: bytes) -> None:
+        """Do nothing with the state of the board.
+        """
+
+
+class TextSink(BoardSink):
+    """A sink that writes every state of a board in full, as the string
+    representation of the board, after a blank line.
+
+    >>> import io
+    >>> out = io.StringIO()
+    >>> sink = TextSink(out)
+    >>> sink.write(0, 3, b'P-BR-@')
+    >>> print(out.getvalue(), end='')
+    <BLANKLINE>
+    P-B
+    R-@
+    """
+    # === Private Attributes ===
+    # _stream:
+    #     the stream the states are written to
+    _stream: TextIO
+
+    def __init__(self, stream: Optional[TextIO] = None) -> None:
+        """Initialize this sink to write to <stream>, or to the standard
+        output if <stream> is None.
+        """
+        self._stream = sys.stdout if stream is None else stream
+
+    def write(self, turn: int, width: int, codes: bytes) -> None:
+        """Write the state of the board in full.
+        """
+        self._stream.write(f'\n{_rows(width, codes)}\n')
+
+    def close(self) -> None:
+        """Flush the stream.
+        """
+        self._stream.flush()
+
+
+class DiffSink(BoardSink):
+    """A sink that writes the first state of a board in full, and then only
+    the tiles that changed since the last state written, one line per state:
+    the turn, followed by the location and new character of every tile that
+    changed. States in which no tile changed are left out.
+
+    >>> import io
+    >>> out = io.StringIO()
+    >>> sink = DiffSink(out)
+    >>> sink.write(0, 3, b'P-B---')
+    >>> sink.write(1, 3, b'-PB---')
+    >>> sink.write(2, 3, b'-PB---')
+    >>> sink.write(3, 3, b'--P-B-')
+    >>> print(out.getvalue(), end='')
+    0:
+    P-B
+    ---
+    1: 0,0- 1,0P
+    3: 1,0- 2,0P 1,1B
+    """
+    # === Private Attributes ===
+    # _stream:
+    #     the stream the states are written to
+    # _codes:
+    #     the tile codes of the last state written, or None if none has been
+    _stream: TextIO
+    _codes: Optional[bytes]
+
+    def __init__(self, stream: Optional[TextIO] = None) -> None:
+        """Initialize this sink to write to <stream>, or to the standard
+        output if <stream> is None.
+        """
+        self._stream = sys.stdout if stream is None else stream
+        self._codes = None
+
+    def write(self, turn: int, width: int, codes: bytes) -> None:
+        """Write the tiles that changed since the last state written, or the
+        whole board if this is the first state or the board changed size.
+        """
+        if self._codes is None or len(self._codes) != len(codes):
+            self._stream.write(f'{turn}:\n{_rows(width, codes)}\n')
+        else:
+            changed = changed_indices(self._codes, codes)
+            if changed:
+                tiles = ' '.join(f'{t % width},{t // width}{chr(codes[t])}'
+                                 for t in changed)
+                self._stream.write(f'{turn}: {tiles}\n')
+        self._codes = codes
+
+    def close(self) -> None:
+        """Flush the stream.
+        """
+        self._stream.flush()
+
+
+class BoardLogger:
+    """A logger that writes the states of a board to a sink on a background
+    thread.
+
+    === Public Attributes ===
+    sink:
+        the sink the states are written to
+    policy:
+        what is done with a state logged while the queue is full: DROP or
+        COALESCE
+    dropped:
+        the number of states logged that were never written, because of
+        the policy
+    failed:
+        the number of states the sink raised an error writing. The first
+        error is reported on the standard error, and the logger carries on
+        with the next state.
+
+    === Sample Usage ===
+    >>> import io
+    >>> out = io.StringIO()
+    >>> b = Raccoons_Revenge.GameBoard(3, 1)
+    >>> b.setup_from_grid('P-B')
+    >>> with BoardLogger(DiffSink(out)) as logger:
+    ...     logger.log(b)
+    ...     b.handle_event(Raccoons_Revenge.RIGHT)
+    ...     b.give_turns()
+    ...     logger.log(b)
+    >>> print(out.getvalue(), end='')
+    0:
+    P-B
+    1: 0,0- 1,0P
+    >>> logger.log(b)
+    Traceback (most recent call last):
+    ...
+    ValueError: log called on a closed BoardLogger
+    """
+    # === Private Attributes ===
+    # _queue:
+    #     the turn, width and tile codes of every state waiting to be
+    #     written, from oldest to newest
+    # _size:
+    #     the most states waiting to be written at once
+    # _condition:
+    #     the condition the background thread waits on for states to write,
+    #     which guards _queue and _closed
+    # _closed:
+    #     whether this logger has been closed
+    # _thread:
+    #     the background thread
+    sink: BoardSink
+    policy: str
+    dropped: int
+    failed: int
+    _queue: Deque[Tuple[int, int, bytes]]
+    _size: int
+    _condition: threading.Condition
+    _closed: bool
+    _thread: threading.Thread
+
+    def __init__(self, sink: BoardSink, size: int = QUEUE_SIZE,
+                 policy: str = COALESCE) -> None:
+        """Initialize this logger to write to <sink>, keeping at most <size>
+        states waiting to be written, and start its background thread.
+
+        Precondition: size > 0 and policy is DROP or COALESCE
+        """
+        self.sink = sink
+        self.policy = policy
+        self.dropped = 0
+        self.failed = 0
+        self._queue = deque()
+        self._size = size
+        self._condition = threading.Condition()
+        self._closed = False
+        # a daemon thread, so that closing the game mid-way is not held up
+        # by the states still waiting to be written
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def __enter__(self) -> BoardLogger:
+        return self
+
+    def __exit__(self, *_: object) -> None:
+        self.close()
+
+    def log(self, board: Raccoons_Revenge.GameBoard) -> None:
+        """Queue the current state of <board> to be written, without waiting
+        for anything to be written.
+
+        If the queue is full, the state is dropped or coalesced with the
+        newest state in the queue, as the policy says.
+
+        Raise a ValueError if this logger has been closed.
+        """
+        with self._condition:
+            if self._closed:
+                raise ValueError('log called on a closed BoardLogger')
+            if isinstance(self.sink, NullSink):
+                return
+            state = (board.turns, board.width, board.tile_codes().tobytes())
+            if len(self._queue) < self._size:
+                self._queue.append(state)
+                self._condition.notify()
+            elif self.policy == COALESCE:
+                self._queue[-1] = state
+                self.dropped += 1
+            else:
+                self.dropped += 1
+
+    def _run(self) -> None:
+        """Write the states in the queue to the sink as they are logged,
+        until this logger is closed and the queue is empty.
+
+        An error raised by the sink does not stop the thread, so that one bad
+        write does not end the log.
+
+        >>> import contextlib, io
+        >>> class BrokenSink(BoardSink):
+        ...     def write(self, turn, width, codes):
+        ...         raise OSError('disk full')
+        >>> b = Raccoons_Revenge.GameBoard(1, 1)
+        >>> errors = io.StringIO()
+        >>> with contextlib.redirect_stderr(errors):
+        ...     with BoardLogger(BrokenSink(), policy=DROP) as logger:
+        ...         logger.log(b)
+        ...         logger.log(b)
+        >>> logger.failed
+        2
+        >>> print(errors.getvalue(), end='')
+        BoardLogger: could not write to BrokenSink: OSError('disk full')
+        """
+        while True:
+            with self._condition:
+                while not self._queue and not self._closed:
+                    self._condition.wait()
+                if not self._queue:
+                    break
+                turn, width, codes = self._queue.popleft()
+            try:
+                self.sink.write(turn, width, codes)
+            except Exception as error:  # the sink could raise anything
+                self.failed += 1
+                if self.failed == 1:
+                    self._report(error)
+        try:
+            self.sink.close()
+        except Exception as error:
+            self._report(error)
+
+    def _report(self, error: Exception) -> None:
+        """Report on the standard error that the sink raised <error>.
+        """
+        sys.stderr.write(f'BoardLogger: could not write to '
+                         f'{type(self.sink).__name__}: {error!r}\n')
+
+    def close(self) -> None:
+        """Write the states still in the queue, close the sink, and stop the
+        background thread. Nothing can be logged after this.
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._thread.join()
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
@@ -0,0 +1,299 @@
+"""Raccoon Raiders replay files
+
+=== Module Description ===
+This module contains a compact binary format for recording games of
+Raccoon Raiders, with a writer that records a game turn by turn as it is
+played, and a reader that memory-maps a recording so that the board after
+any turn can be found without parsing the whole file.
+
+A replay file holds, in order:
+- a header: HEADER (magic, version, width, height, seed and keyframe
+  interval), followed by the tile codes of the board before the first turn
+- one record per turn: TURN (the Player's action, as an index into
+  Raccoons_Revenge_Headless.ACTIONS, and the number of tiles that changed),
+  followed by a DELTA (tile index and new tile code) for each changed tile.
+  After every <keyframe interval> turns, the record is followed by the
+  tile codes of the whole board after that turn.
+- an index, written when the writer is closed: the offset of the record of
+  every turn, followed by TRAILER (the offset of the index, the number of
+  turns and INDEX_MAGIC).
+
+All numbers are little-endian. A file whose writer was not closed has no
+index, and the reader finds the records by scanning instead.
+"""
+
+from __future__ import annotations
+
+import mmap
+import struct
+from array import array
+from typing import BinaryIO, Optional, Tuple
+
+import Raccoons_Revenge
+import Raccoons_Revenge_Headless
+from Raccoons_Revenge_Index import changed_indices
+
+MAGIC = b'RRPL'
+INDEX_MAGIC = b'RRIX'
+VERSION = 1
+
+# magic, version, width, height, seed, keyframe interval
+HEADER = struct.Struct('<4sBIIQI')
+
+# action, number of changed tiles
+TURN = struct.Struct('<BI')
+
+# tile index, tile code
+DELTA = struct.Struct('<IB')
+
+# offset of the index, number of turns, INDEX_MAGIC
+TRAILER = struct.Struct('<QI4s')
+
+# Default number of turns between keyframes
+KEYFRAME_INTERVAL = 64
+
+
+class ReplayWriter:
+    """A writer that records a game into a replay file, one turn at a time.
+
+    === Sample Usage ===
+    >>> import os, tempfile
+    >>> path = os.path.join(tempfile.mkdtemp(), 'game.rrp')
+    >>> board = Raccoons_Revenge.GameBoard(4, 1)
+    >>> board.setup_from_grid('PB--')
+    >>> with ReplayWriter(path, board, seed=7) as writer:
+    ...     for _ in range(2):
+    ...         board.handle_event(Raccoons_Revenge.RIGHT)
+    ...         board.give_turns()
+    ...         writer.record(Raccoons_Revenge.RIGHT)
+    >>> with ReplayReader(path) as reader:
+    ...     print(len(reader), reader.seed, reader.grid_at(1))
+    2 7 -PB-
+    """
+    # === Private Attributes ===
+    # _file:
+    #     the file being written to
+    # _board:
+    #     the board of the game being recorded
+    # _keyframe_interval:
+    #     the number of turns between keyframes
+    # _offsets:
+    #     the offset in the file of the record of every turn recorded
+    # _codes:
+    #     the tile codes of the board as of the last turn recorded, which
+    #     the tile codes after the next turn are compared with
+    _file: BinaryIO
+    _board: Raccoons_Revenge.GameBoard
+    _keyframe_interval: int
+    _offsets: array
+    _codes: bytes
+
+    def __init__(self, path: str, board: Raccoons_Revenge.GameBoard,
+                 seed: int = 0,
+                 keyframe_interval: int = KEYFRAME_INTERVAL) -> None:
+        """Initialize this writer to record the game on <board>, played with
+        the random number generator seeded with <seed>, into a new replay
+        file at <path>, starting from the current state of <board>.
+
+        Precondition: 0 <= seed < 2 ** 64 and keyframe_interval > 0
+        """
+        self._file = open(path, 'wb')
+        self._board = board
+        self._keyframe_interval = keyframe_interval
+        self._offsets = array('Q')
+        self._codes = board.tile_codes().tobytes()
+        self._file.write(HEADER.pack(MAGIC, VERSION, board.width,
+                                     board.height, seed, keyframe_interval))
+        self._file.write(self._codes)
+
+    def __enter__(self) -> ReplayWriter:
+        return self
+
+    def __exit__(self, *_: object) -> None:
+        self.close()
+
+    def record(self, action: Optional[Tuple[int, int]]) -> None:
+        """Record a turn that has just been played on the board, in which the
+        Player was given the move <action>, or no move if <action> is None.
+
+        The tiles that changed are found by comparing the tile codes of the
+        board with those recorded last, so the changed tiles reported by the
+        board's changed_tiles method are left for others to use.
+
+        Precondition: the board has the same size as when this writer was
+        made
+        """
+        codes = self._board.tile_codes().tobytes()
+        changed = changed_indices(self._codes, codes)
+        self._codes = codes
+        self._offsets.append(self._file.tell())
+        record = bytearray(TURN.pack(
+            Raccoons_Revenge_Headless.ACTIONS.index(action), len(changed)))
+        for t in changed:
+            record += DELTA.pack(t, codes[t])
+        if len(self._offsets) % self._keyframe_interval == 0:
+            record += codes
+        self._file.write(record)
+
+    def close(self) -> None:
+        """Write the index of the turns recorded and close the file.
+        """
+        if self._file.closed:
+            return
+        index_offset = self._file.tell()
+        self._file.write(self._offsets.tobytes())
+        self._file.write(TRAILER.pack(index_offset, len(self._offsets),
+                                      INDEX_MAGIC))
+        self._file.close()
+
+
+class ReplayReader:
+    """A reader of a replay file, which memory-maps the file so that only the
+    parts of it that are looked at are read.
+
+    Turns are numbered from 1, and turn 0 stands for the state of the board
+    before the first turn.
+
+    === Public Attributes ===
+    width:
+        the width of the board of the recorded game
+    height:
+        the height of the board of the recorded game
+    seed:
+        the seed of the random number generator of the recorded game
+    """
+    # === Private Attributes ===
+    # _file:
+    #     the replay file
+    # _data:
+    #     the memory-mapped contents of the replay file
+    # _keyframe_interval:
+    #     the number of turns between keyframes
+    # _offsets:
+    #     the offset in the file of the record of every turn
+    width: int
+    height: int
+    seed: int
+    _file: BinaryIO
+    _data: mmap.mmap
+    _keyframe_interval: int
+    _offsets: array
+
+    def __init__(self, path: str) -> None:
+        """Initialize this reader to read the replay file at <path>.
+        """
+        self._file = open(path, 'rb')
+        self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.width, self.height, self.seed, \
+            self._keyframe_interval = HEADER.unpack_from(self._data)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f'{path} is not a replay file')
+        self._offsets = self._read_index()
+
+    def __enter__(self) -> ReplayReader:
+        return self
+
+    def __exit__(self, *_: object) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        """Return the number of turns recorded.
+        """
+        return len(self._offsets)
+
+    def _read_index(self) -> array:
+        """Return the offset of the record of every turn, from the index if
+        the file has one, and otherwise by scanning the records, leaving out
+        a last record that was cut short.
+        """
+        offsets = array('Q')
+        if len(self._data) >= TRAILER.size:
+            index_offset, num_turns, magic = TRAILER.unpack_from(
+                self._data, len(self._data) - TRAILER.size)
+            if magic == INDEX_MAGIC:
+                offsets.frombytes(
+                    self._data[index_offset:index_offset + 8 * num_turns])
+                return offsets
+        n = self.width * self.height
+        offset = HEADER.size + n
+        while offset + TURN.size <= len(self._data):
+            _, num_changed = TURN.unpack_from(self._data, offset)
+            end = offset + TURN.size + num_changed * DELTA.size
+            if (len(offsets) + 1) % self._keyframe_interval == 0:
+                end += n
+            if end > len(self._data):
+                break  # the last record was cut short
+            offsets.append(offset)
+            offset = end
+        return offsets
+
+    def action(self, turn: int) -> Optional[Tuple[int, int]]:
+        """Return the move the Player was given in turn <turn>, or None if it
+        was given none.
+
+        Precondition: 1 <= turn <= len(self)
+        """
+        action, _ = TURN.unpack_from(self._data, self._offsets[turn - 1])
+        return Raccoons_Revenge_Headless.ACTIONS[action]
+
+    def codes_at(self, turn: int) -> bytes:
+        """Return the tile codes of the board after <turn> turns, as given by
+        GameBoard.tile_codes.
+
+        This starts from the last keyframe at or before <turn>, so it only
+        applies the changes of fewer than the keyframe interval turns.
+
+        Precondition: 0 <= turn <= len(self)
+        """
+        n = self.width * self.height
+        start = turn - turn % self._keyframe_interval
+        if start == 0:
+            codes = bytearray(self._data[HEADER.size:HEADER.size + n])
+        else:
+            offset = self._offsets[start - 1]
+            _, num_changed = TURN.unpack_from(self._data, offset)
+            offset += TURN.size + num_changed * DELTA.size
+            codes = bytearray(self._data[offset:offset + n])
+        for k in range(start, turn):
+            offset = self._offsets[k]
+            _, num_changed = TURN.unpack_from(self._data, offset)
+            for t, code in DELTA.iter_unpack(self._data[
+                    offset + TURN.size:
+                    offset + TURN.size + num_changed * DELTA.size]):
+                codes[t] = code
+        return bytes(codes)
+
+    def grid_at(self, turn: int) -> str:
+        """Return the string representation of the board after <turn> turns,
+        in the format of GameBoard.setup_from_grid.
+
+        Precondition: 0 <= turn <= len(self)
+        """
+        codes = self.codes_at(turn)
+        return '\n'.join(codes[y * self.width:(y + 1) * self.width].decode()
+                         for y in range(self.height))
+
+    def board_at(self, turn: int) -> Raccoons_Revenge.GameBoard:
+        """Return a new board set up as the recorded board was after <turn>
+        turns, with its turn count set to match.
+
+        As with setup_from_grid, a raccoon inside a garbage can is always
+        set up as a Raccoon.
+
+        Precondition: 0 <= turn <= len(self)
+        """
+        board = Raccoons_Revenge.GameBoard(self.width, self.height)
+        board.setup_from_grid(self.grid_at(turn))
+        board.turns = turn
+        return board
+
+    def close(self) -> None:
+        """Close the replay file.
+        """
+        self._data.close()
+        self._file.close()
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()